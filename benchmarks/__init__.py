@@ -0,0 +1,14 @@
+# offline microbenchmarks for the request hot paths, run them with
+# `python -m benchmarks`. a benchmark is a function that does its setup and
+# returns the zero-argument callable to be timed.
+from typing import Callable, Dict
+
+registry: Dict[str, Callable[[], Callable[[], object]]] = {}
+
+
+def benchmark(name: str):
+    def decorator(func):
+        registry[name] = func
+        return func
+
+    return decorator
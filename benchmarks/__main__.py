@@ -0,0 +1,105 @@
+# python -m benchmarks [-k filter] [--json out.json] [--compare baseline.json]
+#
+# every benchmark is timed in `--repeat` rounds of enough calls to take about
+# `--round` seconds, the best round counts. with --compare, benchmarks that got
+# more than `--threshold` slower than the baseline fail the run.
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+import timeit
+
+from . import registry
+from . import hot_paths  # noqa: F401, registers the benchmarks
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _time(func, repeat: int, round_time: float) -> dict:
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    number = max(1, int(number * round_time / 0.2))
+    rounds = [t / number for t in timer.repeat(repeat=repeat, number=number)]
+
+    return {'best_ns': min(rounds) * 1e9, 'median_ns': sorted(rounds)[len(rounds) // 2] * 1e9, 'number': number}
+
+def run(pattern: str, repeat: int, round_time: float) -> dict:
+    results = {}
+
+    for name, setup in registry.items():
+        if pattern and pattern not in name:
+            continue
+
+        try:
+            func = setup()
+        except ImportError as exc:
+            # e.g. the database driver isn't installed, the rest still runs.
+            print(f'{name:<32} skipped ({exc})')
+            continue
+
+        results[name] = r = _time(func, repeat, round_time)
+        print(f'{name:<32} {r["best_ns"]:12.0f}ns')
+
+    return results
+
+def compare(results: dict, baseline: dict, threshold: float) -> bool:
+    ok = True
+
+    print()
+
+    for name, r in results.items():
+        before = baseline.get(name)
+
+        if before is None:
+            continue
+
+        change = r['best_ns'] / before['best_ns'] - 1
+        slower = change > threshold
+        ok = ok and not slower
+
+        print(f'{name:<32} {before["best_ns"]:12.0f}ns -> {r["best_ns"]:12.0f}ns {change:+8.1%}{"  SLOWER" if slower else ""}')
+
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    parser.add_argument('-k', dest='pattern', default='', help='only run benchmarks whose name contains this')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--round', type=float, default=0.2, help='seconds per round')
+    parser.add_argument('--json', help='write results to this file')
+    parser.add_argument('--compare', help='results file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.10, help='allowed slowdown, 0.10 is 10%%')
+    args = parser.parse_args()
+
+    results = run(args.pattern, args.repeat, args.round)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                'commit': _commit(),
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'time': time.time(),
+                'results': results,
+            }, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+
+        return 0 if compare(results, baseline, args.threshold) else 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,83 @@
+# documents shaped like the ones the routes store and send, built through
+# rails.api.v3.projections the same way the routes build them, so payloads
+# track the real shapes when fields change.
+import datetime
+
+from rails.api.v3.projections import project
+
+guild_id = '1115372042563584001'
+channel_id = '1115372042563584007'
+author_id = '1115372042563584042'
+role_ids = ('1115372042563584003', '1115372042563584004')
+
+content = (
+    f'hey <@{author_id}> and <@&{role_ids[0]}>, check <#{channel_id}> '
+    'for the notes <:pog:1115372042563584099> ' * 4
+)
+
+
+def _id(i: int) -> str:
+    return str(1115372042563585000 + i)
+
+def _at(i: int) -> str:
+    return datetime.datetime(2023, 6, 21, 12, i // 60 % 60, i % 60, tzinfo=datetime.timezone.utc).isoformat()
+
+def user(i: int) -> dict:
+    # as stored, credentials included.
+    return {
+        '_id': author_id if i == 0 else _id(i),
+        'username': f'user{i}',
+        'separator': str(i % 9999 + 1).zfill(4),
+        'bio': '',
+        'avatar_url': None,
+        'banner_url': None,
+        'flags': 1 << 2,
+        'email': 'f' * 64,
+        'password': '$scrypt$' + 'a' * 88,
+        'system': False,
+        'verified': True,
+        'email_verified': True,
+        'blocked_users': [],
+        'bot': False,
+        'created_at': _at(i),
+    }
+
+def member(i: int) -> dict:
+    # as stored, roles resolved to what permission checks read.
+    u = user(i)
+
+    return {
+        'id': u['_id'],
+        'user': project(u, 'public_user'),
+        'nick': None,
+        'avatar_url': None,
+        'banner_url': None,
+        'joined_at': _at(i),
+        'deaf': False,
+        'mute': False,
+        'owner': False,
+        'guild_id': guild_id,
+        'roles': [
+            {'_id': role_ids[0], 'permissions': 1 << 12},
+            {'_id': role_ids[1], 'permissions': 1 << 19},
+        ],
+    }
+
+def member_summary(i: int) -> dict:
+    # one entry of a member listing.
+    return project(member(i), 'member_summary')
+
+def message(i: int) -> dict:
+    # as guilds.messages.create_message stores and returns it.
+    author = project(member(0), 'message_author')
+    author['_id'] = author.pop('id')
+
+    return {
+        '_id': _id(i),
+        'author': author,
+        'content': content,
+        'tts': False,
+        'embeds': [],
+        'created_at': _at(i),
+        'channel_id': channel_id,
+    }
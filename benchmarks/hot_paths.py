@@ -0,0 +1,108 @@
+import random
+
+from . import benchmark
+from .fixtures import channel_id, content, guild_id, member, member_summary, message, role_ids
+
+
+@benchmark('permissions.Permissions')
+def permissions_construct():
+    from rails.api.v3.permissions import Permissions
+
+    return lambda: Permissions(0b1011_0000_0000_0001).send_messages
+
+@benchmark('permissions.compute')
+def permissions_compute():
+    from rails.api.v3.permissions import compute
+
+    guild = {'_id': guild_id, 'owner': '1', 'default_permission': 1}
+    channel = {'_id': channel_id, 'bypass': [{'_id': role_ids[0], 'value': 1 << 13}]}
+    m = member(0)
+
+    return lambda: compute(guild, m, channel)
+
+@benchmark('messages._verify_embed')
+def verify_embed():
+    from rails.api.v3.guilds.messages import _verify_embed
+
+    embed = {
+        'title': 'release notes',
+        'description': 'everything that changed this week, in short',
+        'url': 'https://example.com/notes',
+        'timestamp': '2022-01-01T12:00:00',
+        'color': 0x5865f2,
+        'fields': [{'name': 'fixes', 'value': 'a lot'}, {'name': 'features', 'value': 'some'}],
+        'author': {'name': 'vincent', 'url': 'https://example.com', 'avatar_url': 'https://example.com/a.png'},
+    }
+
+    # it pops what it keeps, every call gets a fresh copy like a request would.
+    return lambda: _verify_embed({**embed, 'fields': list(embed['fields']), 'author': dict(embed['author'])})
+
+@benchmark('data_bodys.get_mentions')
+def get_mentions():
+    from rails.api.v3.data_bodys import get_mentions
+
+    return lambda: get_mentions(content)
+
+@benchmark('data_bodys.emote+channel')
+def emotes_and_channels():
+    from rails.api.v3.data_bodys import channel, emote
+
+    return lambda: (emote.findall(content), channel.findall(content))
+
+@benchmark('snowflakes.snowflake')
+def make_snowflake():
+    from rails.api.v3.snowflakes import snowflake
+
+    return snowflake
+
+@benchmark('snowflakes.snowflakes(100)')
+def make_snowflakes():
+    from rails.api.v3.snowflakes import snowflakes
+
+    return lambda: snowflakes(100)
+
+@benchmark('snowflakes.hash_from')
+def hash_from():
+    from rails.api.v3.snowflakes import hash_from
+
+    return hash_from
+
+@benchmark('rate.acquire (100k keys)')
+def rate_acquire():
+    from rails.api.v3.rate_storage import MemoryStorage, parse_limits
+
+    storage = MemoryStorage()
+    limits = parse_limits('5/second,50/minute,10000/hour')
+
+    for i in range(100000):
+        storage.acquire(('guilds-v3.get_guild', str(i)), limits, 0.0)
+
+    # every other call goes to one of a few hot keys that stay over their
+    # limits, the rest walk a large part of the table and get through. the
+    # clock moves 10us a call, so cold keys come back after 1.3s, when their
+    # buckets have expired, and the sweep runs like it does under traffic.
+    hot = [('guilds-v3.get_guild', str(i)) for i in range(64)]
+    cold = [('guilds-v3.get_guild', str(i)) for i in random.sample(range(64, 100000), 65536)]
+    keys = [k for pair in zip(hot * 1024, cold) for k in pair]
+    state = {'i': 0, 'now': 0.0}
+
+    def run():
+        i = state['i'] = (state['i'] + 1) & 131071
+        state['now'] += 1e-5
+        storage.acquire(keys[i], limits, state['now'])
+
+    return run
+
+@benchmark('encoding.dumps messages(50)')
+def dumps_messages():
+    from rails.api.encoding import dumps
+
+    page = [message(i) for i in range(50)]
+    return lambda: dumps(page)
+
+@benchmark('encoding.dumps members(1000)')
+def dumps_members():
+    from rails.api.encoding import dumps
+
+    page = [member_summary(i) for i in range(1000)]
+    return lambda: dumps(page)
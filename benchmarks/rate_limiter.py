@@ -0,0 +1,97 @@
+# per-request cost of the limiter as the number of tracked buckets grows, it
+# should stay flat all the way up to a million keys. with --processes, that
+# many processes hammer one bucket of the shared storage and the number of
+# requests let through is checked against the limit.
+#
+#   python -m benchmarks.rate_limiter [--storage memory|shared] [--keys 1000000]
+#   python -m benchmarks.rate_limiter --storage shared --processes 8
+import argparse
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+from rails.api.v3.rate_storage import MemoryStorage, SharedMemoryStorage, Storage, parse_limits
+
+limits = parse_limits('5/second,50/minute,10000/hour')
+
+
+def _storage(kind: str, path: str, keys: int) -> Storage:
+    if kind == 'memory':
+        return MemoryStorage()
+
+    # twice the keys, so groups don't overflow.
+    return SharedMemoryStorage(path, keys * 2)
+
+def _fill(storage: Storage, start: int, n: int, now: float):
+    for i in range(start, n):
+        storage.acquire(('guilds-v3.get_guild', str(i)), limits, now)
+
+def _measure(storage: Storage, n: int, number: int, now: float) -> float:
+    keys = [('guilds-v3.get_guild', str(random.randrange(n))) for _ in range(number)]
+    # a tenth of the requests come from clients the limiter hasn't seen yet.
+    keys[::10] = [('guilds-v3.get_guild', f'new-{n}-{i}') for i in range(len(keys[::10]))]
+
+    start = time.perf_counter()
+
+    for key in keys:
+        storage.acquire(key, limits, now)
+
+    return (time.perf_counter() - start) / number
+
+def _hammer(path: str, slots: int, count: int, out):
+    storage = SharedMemoryStorage(path, slots)
+    one = parse_limits('1000/hour')
+    out.put(sum(storage.acquire(('bench', 'one-key'), one).allowed for _ in range(count)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--storage', choices=('memory', 'shared'), default='memory')
+    parser.add_argument('--keys', type=int, default=1000000)
+    parser.add_argument('--number', type=int, default=200000)
+    parser.add_argument('--processes', type=int, default=0)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.gettempdir(), f'rails-ratelimit-bench-{os.getpid()}')
+
+    try:
+        if args.processes:
+            out = multiprocessing.Queue()
+            procs = [
+                multiprocessing.Process(target=_hammer, args=(path, 1024, 500, out))
+                for _ in range(args.processes)
+            ]
+            start = time.perf_counter()
+
+            for p in procs:
+                p.start()
+
+            allowed = sum(out.get() for _ in procs)
+
+            for p in procs:
+                p.join()
+
+            took = time.perf_counter() - start
+            print(f'{args.processes} processes, {args.processes * 500} requests in {took:.2f}s, {allowed} allowed (limit 1000)')
+            return
+
+        storage = _storage(args.storage, path, args.keys)
+        now = time.time()
+        filled = 0
+        n = 1000
+
+        while n <= args.keys:
+            _fill(storage, filled, n, now)
+            filled = n
+            per = _measure(storage, n, args.number, now)
+            print(f'{args.storage:>6} {n:>9} keys  {per * 1e9:8.0f}ns per request')
+            n *= 10
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+# compares the stdlib json path the routes used to take with rails.api.encoding,
+# on payloads shaped like a message history page and a member listing.
+#
+#   python -m benchmarks.serialization [--number N]
+import argparse
+import json
+import timeit
+
+from rails.api.encoding import dumps
+
+from .fixtures import member_summary, message
+
+payloads = {
+    'messages (page of 50)': [message(i) for i in range(50)],
+    'members (page of 1000)': [member_summary(i) for i in range(1000)],
+    'error body': {'message': '404: Not Found', 'code': 0},
+}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--number', type=int, default=2000)
+    args = parser.parse_args()
+
+    for name, payload in payloads.items():
+        # the old path built a str and let the server encode it afterwards.
+        stdlib = timeit.timeit(lambda: json.dumps(payload).encode(), number=args.number)
+        fast = timeit.timeit(lambda: dumps(payload), number=args.number)
+        per = 1e6 / args.number
+
+        print(f'{name:<24} json {stdlib * per:9.1f}us  orjson {fast * per:9.1f}us  x{stdlib / fast:.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,5 @@
+# end-to-end load harness. boots rails.core.app in-process against an
+# in-memory mongo (`mongomock://`, needs `pip install mongomock-motor`) or any
+# mongo_uri, with a local websocket server standing in for the gateway, fills
+# it with a synthetic dataset and drives scripted scenarios through the app's
+# test client. see `python -m loadtest --help`.
@@ -0,0 +1,94 @@
+# python -m loadtest [scenario ...] [--guilds 10 --members 200 --channels 5 --messages 100]
+#                    [--requests 2000] [--concurrency 50] [--mongo-uri mongodb://localhost]
+#                    [--backend memory] [--json out.json]
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+from .gateway import FakeGateway
+from .scenarios import Recorder, scenarios
+
+
+def _configure(args, gateway_url: str):
+    # read by rails at import time.
+    os.environ.update({
+        'mongo_uri': args.mongo_uri,
+        'storage_backend': args.backend,
+        'gateway_url': gateway_url,
+        # the harness measures the api, not the limiter or the log.
+        'ratelimit_enabled': '0',
+        'access_log_sample': '0',
+        'index_gate': '0',
+        'snowflake_lease': 'none',
+        'session_legacy_fallback': '0',
+    })
+
+async def main(args) -> int:
+    gateway = FakeGateway()
+    await gateway.start()
+    _configure(args, gateway.url)
+
+    from rails.core import app
+    from .dataset import generate
+
+    recorder = Recorder()
+
+    async with app.test_app() as test_app:
+        ds = await generate(
+            args.guilds, args.members, args.channels, args.messages,
+            outsiders=args.requests if 'invite_join' in args.scenarios else 0,
+        )
+        print(f'dataset: {args.guilds} guilds x {args.members} members, {args.channels} channels x {args.messages} messages')
+
+        client = test_app.test_client()
+
+        for name in args.scenarios:
+            await scenarios[name](client, ds, recorder, args.requests, args.concurrency)
+
+        # let the writer flush what the scenarios dispatched.
+        await asyncio.sleep(0.5)
+
+    await gateway.stop()
+
+    report = recorder.report()
+
+    print()
+    print(f'{"route":<44} {"req":>6} {"req/s":>8} {"p50":>8} {"p95":>8} {"p99":>8}  statuses')
+
+    for route, r in report.items():
+        print(
+            f'{route:<44} {r["requests"]:>6} {r["throughput"] or 0:>8.0f} '
+            f'{r["p50_ms"]:>7.1f}ms {r["p95_ms"]:>7.1f}ms {r["p99_ms"]:>7.1f}ms  {r["statuses"]}'
+        )
+
+    print(f'\ngateway: {gateway.frames} frames, {dict(gateway.events)}')
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'routes': report, 'gateway': {'frames': gateway.frames, 'events': gateway.events}}, f, indent=2)
+
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='python -m loadtest')
+    parser.add_argument('scenarios', nargs='*', metavar='scenario', help=', '.join(scenarios) + ' (default: all)')
+    parser.add_argument('--guilds', type=int, default=10)
+    parser.add_argument('--members', type=int, default=200)
+    parser.add_argument('--channels', type=int, default=5)
+    parser.add_argument('--messages', type=int, default=100)
+    parser.add_argument('--requests', type=int, default=2000, help='per scenario')
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--mongo-uri', default=os.getenv('loadtest_mongo_uri', 'mongomock://'))
+    parser.add_argument('--backend', choices=('mongo', 'memory'), default='mongo', help='storage_backend to serve from')
+    parser.add_argument('--json', help='write the report to this file')
+    args = parser.parse_args()
+    args.scenarios = args.scenarios or list(scenarios)
+
+    for name in args.scenarios:
+        if name not in scenarios:
+            parser.error(f'unknown scenario {name!r}')
+
+    sys.exit(asyncio.run(main(args)))
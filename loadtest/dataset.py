@@ -0,0 +1,135 @@
+# synthetic data written straight through the repositories: `guilds` guilds with
+# `members` members each, `channels` text channels per guild and `messages`
+# messages per channel. every user gets a session token to make requests with.
+# rails is imported inside the functions, the harness configures it through
+# the environment first.
+import dataclasses
+import datetime
+from typing import Dict, List
+
+
+@dataclasses.dataclass
+class Dataset:
+    # guild id -> member tokens, the first one is the owner's.
+    tokens: Dict[str, List[str]] = dataclasses.field(default_factory=dict)
+    # guild id -> text channel ids.
+    channels: Dict[str, List[str]] = dataclasses.field(default_factory=dict)
+    # guild id -> invite code.
+    invites: Dict[str, str] = dataclasses.field(default_factory=dict)
+    # users that aren't in any guild yet, for invite joins.
+    outsiders: List[str] = dataclasses.field(default_factory=list)
+
+
+def _user(_id: str, n: int, password: str):
+    from rails.api.v3.encrypt import get_hash_for
+
+    return {
+        '_id': _id,
+        'username': f'user{n}',
+        'separator': str(n % 9999 + 1).zfill(4),
+        'bio': '',
+        'avatar_url': None,
+        'banner_url': None,
+        'flags': 1 << 2,
+        'verified': False,
+        'email': get_hash_for(f'user{n}@example.com'),
+        'password': password,
+        'system': False,
+        'email_verified': True,
+        'blocked_users': [],
+        'bot': False,
+        'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    }
+
+def _member(user: dict, guild_id: str, owner: bool):
+    from rails.api.v3.projections import project
+
+    return {
+        'id': user['_id'],
+        'user': project(user, 'public_user'),
+        'nick': None,
+        'avatar_url': None,
+        'banner_url': None,
+        'joined_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'deaf': False,
+        'mute': False,
+        'owner': owner,
+        'guild_id': guild_id,
+        'roles': [],
+    }
+
+async def generate(guilds: int, members: int, channels: int, messages: int, outsiders: int = 0) -> Dataset:
+    from rails.api.v3 import repos
+    from rails.api.v3.encrypt import hash_password
+    from rails.api.v3.sessions import create_session
+    from rails.api.v3.snowflakes import code, snowflakes
+
+    ds = Dataset()
+    # one real hash for everyone, scrypt per user would dominate the setup.
+    password = await hash_password('password')
+    n = 0
+
+    for guild_id in snowflakes(guilds):
+        users = []
+
+        for user_id in snowflakes(members):
+            users.append(_user(user_id, n, password))
+            n += 1
+
+        await repos.users.create_many(users)
+        await repos.members.create_many([_member(u, guild_id, i == 0) for i, u in enumerate(users)])
+        ds.tokens[guild_id] = [await create_session(u['_id']) for u in users]
+
+        await repos.guilds.create({
+            '_id': guild_id,
+            'name': f'guild {guild_id}',
+            'description': '',
+            'owner': users[0]['_id'],
+            'emojis': [],
+            'roles': [],
+            'default_permission': 1 << 0 | 1 << 7 | 1 << 12 | 1 << 13 | 1 << 15 | 1 << 20,
+        })
+
+        ds.channels[guild_id] = snowflakes(channels)
+        await repos.channels.create_many([
+            {
+                '_id': channel_id,
+                'name': f'channel-{i}',
+                'description': '',
+                'type': 2,
+                'guild_id': guild_id,
+                'inside_of': 0,
+                'position': i,
+                'banner_url': '',
+                'bypass': [],
+                'pinned_messages': [],
+            }
+            for i, channel_id in enumerate(ds.channels[guild_id])
+        ])
+
+        for channel_id in ds.channels[guild_id]:
+            for i, message_id in enumerate(snowflakes(messages)):
+                author = users[i % len(users)]
+                await repos.messages.create(channel_id, {
+                    '_id': message_id,
+                    'author': {'_id': author['_id'], 'nick': None, 'avatar_url': None},
+                    'content': f'message {i} in {channel_id}',
+                    'tts': False,
+                    'embeds': [],
+                    'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                })
+
+        ds.invites[guild_id] = str(code())
+        await repos.invites.create(guild_id, ds.invites[guild_id])
+
+    lonely = []
+
+    for user_id in snowflakes(outsiders):
+        lonely.append(_user(user_id, n, password))
+        n += 1
+
+    if lonely:
+        await repos.users.create_many(lonely)
+        ds.outsiders = [await create_session(u['_id']) for u in lonely]
+
+    return ds
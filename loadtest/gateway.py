@@ -0,0 +1,41 @@
+# a gateway that accepts the api's connection and records what it's sent.
+import json
+from collections import Counter
+from websockets import server
+
+
+class FakeGateway:
+    def __init__(self):
+        self.frames = 0
+        self.events = Counter()
+        self.sessions = []
+        self._server = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f'ws://{host}:{port}'
+
+    def _record(self, event: dict):
+        if event.get('t') == 'BATCH':
+            for e in event['d']:
+                self._record(e)
+            return
+
+        d = event.get('d') or {}
+        self.events[f"{event.get('t')} {d.get('event_name') or d.get('name') or event.get('type') or ''}".strip()] += 1
+
+    async def _handler(self, ws, *_):
+        # the first frame identifies the api, everything after is events.
+        self.sessions.append(json.loads(await ws.recv()))
+
+        async for frame in ws:
+            self.frames += 1
+            self._record(json.loads(frame))
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0):
+        self._server = await server.serve(self._handler, host, port)
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
@@ -0,0 +1,129 @@
+# scripted load. a scenario fires `requests` requests through the test client,
+# at most `concurrency` at a time, and records each one under its route.
+import asyncio
+import itertools
+import random
+import time
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, List
+
+from .dataset import Dataset
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+        self.elapsed: Dict[str, float] = {}
+
+    async def timed(self, route: str, request: Awaitable):
+        start = time.perf_counter()
+        response = await request
+        self.latencies[route].append(time.perf_counter() - start)
+        self.statuses[route][response.status_code] += 1
+
+        # the body is read like a real client would.
+        await response.get_data()
+
+    def report(self) -> Dict[str, dict]:
+        out = {}
+
+        for route, values in self.latencies.items():
+            values = sorted(values)
+
+            def pct(p: float) -> float:
+                return values[min(len(values) - 1, int(len(values) * p))] * 1000
+
+            out[route] = {
+                'requests': len(values),
+                'throughput': len(values) / self.elapsed[route] if self.elapsed.get(route) else None,
+                'p50_ms': pct(0.50),
+                'p95_ms': pct(0.95),
+                'p99_ms': pct(0.99),
+                'statuses': dict(self.statuses[route]),
+            }
+
+        return out
+
+
+async def _drive(recorder: Recorder, route: str, requests: int, concurrency: int, make: Callable[[int], Awaitable]):
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        async with slots:
+            await recorder.timed(route, make(i))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    recorder.elapsed[route] = recorder.elapsed.get(route, 0) + time.perf_counter() - start
+
+
+async def message_storm(client, ds: Dataset, recorder: Recorder, requests: int, concurrency: int):
+    # every member of every guild posting into random channels.
+    senders = [(token, guild_id) for guild_id, tokens in ds.tokens.items() for token in tokens]
+
+    def make(i: int):
+        token, guild_id = senders[i % len(senders)]
+        channel_id = random.choice(ds.channels[guild_id])
+
+        return client.post(
+            f'/v3/channels/{channel_id}/messages/create',
+            json={'content': f'storm message {i}'},
+            headers={'Authorization': token},
+        )
+
+    await _drive(recorder, 'POST /v3/channels/<id>/messages/create', requests, concurrency, make)
+
+async def message_history(client, ds: Dataset, recorder: Recorder, requests: int, concurrency: int):
+    def make(i: int):
+        guild_id = random.choice(list(ds.channels))
+
+        return client.get(
+            f'/v3/channels/{random.choice(ds.channels[guild_id])}/messages?limit=50',
+            headers={'Authorization': random.choice(ds.tokens[guild_id])},
+        )
+
+    await _drive(recorder, 'GET /v3/channels/<id>/messages', requests, concurrency, make)
+
+async def member_list(client, ds: Dataset, recorder: Recorder, requests: int, concurrency: int):
+    def make(i: int):
+        guild_id = random.choice(list(ds.tokens))
+
+        return client.get(
+            f'/v3/guilds/{guild_id}/members?limit=1000',
+            headers={'Authorization': random.choice(ds.tokens[guild_id])},
+        )
+
+    await _drive(recorder, 'GET /v3/guilds/<id>/members', requests, concurrency, make)
+
+async def signup_burst(client, ds: Dataset, recorder: Recorder, requests: int, concurrency: int):
+    run = random.randrange(1 << 30)
+
+    def make(i: int):
+        return client.post('/v3/users/@me/signup', json={
+            'username': f'burst{i}',
+            'separator': str(i % 9999 + 1).zfill(4),
+            'email': f'burst-{run}-{i}@example.com',
+            'password': 'password',
+        })
+
+    await _drive(recorder, 'POST /v3/users/@me/signup', requests, concurrency, make)
+
+async def invite_join(client, ds: Dataset, recorder: Recorder, requests: int, concurrency: int):
+    # each outsider joins one guild, so there are at most that many joins.
+    joins = list(zip(ds.outsiders, itertools.cycle(ds.invites.values())))[:requests]
+
+    def make(i: int):
+        token, invite = joins[i]
+        return client.post(f'/v3/guilds/invites/{invite}', headers={'Authorization': token})
+
+    await _drive(recorder, 'POST /v3/guilds/invites/<code>', len(joins), concurrency, make)
+
+
+scenarios = {
+    'message_storm': message_storm,
+    'message_history': message_history,
+    'member_list': member_list,
+    'signup_burst': signup_burst,
+    'invite_join': invite_join,
+}
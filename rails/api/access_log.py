@@ -0,0 +1,85 @@
+# structured access log, one json line per sampled request.
+#
+# records are handed to a queue and written by a listener thread, so a slow
+# stdout never holds up a request. `access_log_sample` is the default rate
+# (0 to 1), `access_log_routes` overrides it per endpoint, e.g.
+# `messages-v3.get_messages=0.01,me-v3.get_me=0`. 5xx responses are always
+# logged. bodies are only read with `access_log_capture_body=1`.
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+from . import instrumentation
+from .encoding import dumps
+
+sample_rate = float(os.getenv('access_log_sample', 1))
+route_rates = {
+    k.strip(): float(v)
+    for k, _, v in (r.partition('=') for r in os.getenv('access_log_routes', '').split(',') if r)
+}
+capture_body = os.getenv('access_log_capture_body') == '1'
+# captured bodies are cut off after this many bytes.
+capture_limit = int(os.getenv('access_log_capture_limit', 2048))
+
+logger = logging.getLogger('rails.access')
+logger.propagate = False
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    # the default prepare() formats on the calling thread, leave that to the listener.
+    def prepare(self, record):
+        return record
+
+class _JSONFormatter(logging.Formatter):
+    def format(self, record):
+        return dumps(record.msg).decode()
+
+
+_queue = queue.SimpleQueue()
+_stream = logging.StreamHandler(sys.stdout)
+_stream.setFormatter(_JSONFormatter())
+_listener = logging.handlers.QueueListener(_queue, _stream)
+logger.addHandler(_QueueHandler(_queue))
+logger.setLevel(logging.INFO)
+
+
+def start():
+    _listener.start()
+
+def stop():
+    # flushes whatever is still queued.
+    _listener.stop()
+
+def _sampled(endpoint: str, status: int) -> bool:
+    if status >= 500:
+        return True
+
+    rate = route_rates.get(endpoint, sample_rate)
+
+    return rate >= 1 or random.random() < rate
+
+async def finish(request, response):
+    r = instrumentation.current()
+
+    if r is None or not _sampled(request.endpoint, response.status_code):
+        return
+
+    entry = {
+        'method': request.method,
+        'route': request.url_rule.rule if request.url_rule else None,
+        'endpoint': request.endpoint,
+        'status': response.status_code,
+        'latency_ms': round((time.perf_counter() - r.start) * 1000, 3),
+        'db_calls': r.db_calls,
+        # None for streamed bodies, their size isn't known up front.
+        'size': response.content_length,
+        'remote': request.remote_addr,
+    }
+
+    if capture_body and response.content_length is not None:
+        entry['body'] = (await response.get_data())[:capture_limit].decode(errors='replace')
+
+    logger.info(entry)
@@ -0,0 +1,41 @@
+# json for responses, request bodies and gateway frames, backed by orjson.
+import decimal
+import orjson
+from bson import Decimal128, ObjectId
+from quart import Response
+from quart.json.provider import DefaultJSONProvider
+
+# datetimes out of mongo are naive utc, orjson writes them as RFC 3339.
+_options = orjson.OPT_NAIVE_UTC | orjson.OPT_NON_STR_KEYS
+
+
+def _default(obj):
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, Decimal128):
+        return str(obj.to_decimal())
+    if isinstance(obj, decimal.Decimal):
+        return str(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+def dumps(obj) -> bytes:
+    return orjson.dumps(obj, default=_default, option=_options)
+
+loads = orjson.loads
+
+def respond(body, status: int = 200) -> Response:
+    # bytes and str are sent as they are, so prebuilt bodies cost nothing.
+    if not isinstance(body, (bytes, str)):
+        body = dumps(body)
+
+    return Response(body, status, content_type='application/json')
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    def dumps(self, obj, **kwargs) -> str:
+        return dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
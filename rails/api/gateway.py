@@ -1,45 +1,221 @@
-import json
+import os
+import time
+import uuid
+import random
+from collections import deque
 from websockets import client
-from asyncio import get_running_loop, sleep
+from asyncio import Event, get_running_loop, sleep
+from .encoding import dumps
 
+gateway_url = os.getenv('gateway_url', 'wss://gateway-prd-1.senpai-is-best.xyz')
+gateway_session = os.getenv('gateway_session_id', 'adb8ddecad0ec633da6651a1b441026fdc646892')
+
+# events are queued and sent by a single writer, so dispatching never waits on
+# the gateway. once `queue_size` events are waiting, `overflow` decides what
+# happens: 'drop_oldest', 'drop_newest' or 'block' the dispatching request.
+# with `spill_path` set, overflowing events are appended to that file instead
+# and read back in order once the queue has drained.
+queue_size = int(os.getenv('gateway_queue_size', 10000))
+overflow = os.getenv('gateway_overflow', 'drop_oldest')
+spill_path = os.getenv('gateway_spill_path')
+# up to `batch_size` events are sent as one BATCH frame, the writer waits
+# `batch_linger` for more events before sending a partial batch.
+batch_size = int(os.getenv('gateway_batch_size', 50))
+batch_linger = float(os.getenv('gateway_batch_linger_ms', 2)) / 1000
+# every event carries (o, s), the gateway drops duplicates by it. the last
+# `replay_window` sent events are sent again after a reconnect, since a frame
+# written right before the connection dropped may never have arrived.
+replay_window = int(os.getenv('gateway_replay_window', 256))
+backoff_base = float(os.getenv('gateway_backoff_base', 0.5))
+backoff_max = float(os.getenv('gateway_backoff_max', 30))
+
+origin = uuid.uuid4().hex
+ws = None
+_seq = 0
+_queue = deque()
+_sent = deque(maxlen=replay_window)
+_ready = Event()
+_space = Event()
+_connected = Event()
+_writer_task = None
+_spilled = 0
+_spill_offset = 0
+
+metrics = {
+    'queued': 0,
+    'sent': 0,
+    'dropped': 0,
+    'spilled': 0,
+    'replayed': 0,
+    'reconnects': 0,
+    'batches': 0,
+    'failed_sends': 0,
+    'max_depth': 0,
+    'send_seconds_total': 0.0,
+    'send_seconds_max': 0.0,
+}
+
+
+def get_metrics():
+    return {**metrics, 'depth': len(_queue), 'spill_depth': _spilled, 'connected': _connected.is_set()}
 
 async def connect():
+    global _writer_task
+    if _writer_task is None:
+        _load_spill()
+        _writer_task = get_running_loop().create_task(_writer())
     return await real_connect()
 
 async def real_connect():
+    # reconnects as soon as the socket closes, backing off (with full jitter)
+    # only while the gateway keeps refusing us.
     global ws
-    print(f'Connecting to wss://gateway-prd-1.senpai-is-best.xyz')
-    ws = await client.connect(
-        'wss://gateway-prd-1.senpai-is-best.xyz',
-        ping_timeout=20,
-        close_timeout=10000000
-    )
-    await ws.send(
-        json.dumps({'session_id': 'adb8ddecad0ec633da6651a1b441026fdc646892'})
-    )
-    print('Connected')
-    await check_if_closed()
-
-
-async def check_if_closed():
-    await sleep(1)
-    global ws
-    if not ws or ws.closed:
+    attempt = 0
+
+    while True:
         try:
-            ws = await client.connect('wss://gateway-prd-1.senpai-is-best.xyz', ping_timeout=20)
+            print(f'Connecting to {gateway_url}')
+            ws = await client.connect(
+                gateway_url,
+                ping_timeout=20,
+                close_timeout=10
+            )
             await ws.send(
-                json.dumps({'session_id': 'adb8ddecad0ec633da6651a1b441026fdc646892'})
+                dumps({'session_id': gateway_session}).decode()
             )
-        except:
-            get_running_loop().create_task(check_if_closed())
-    else:
-        await sleep(5)
-        get_running_loop().create_task(check_if_closed())
+        except Exception as exc:
+            delay = random.uniform(0, min(backoff_max, backoff_base * 2 ** attempt))
+            attempt += 1
+            print(f'Gateway connection failed ({exc!r}), retrying in {delay:.1f}s')
+            await sleep(delay)
+            continue
+
+        print('Connected')
+        attempt = 0
+        _replay()
+        _connected.set()
+
+        await ws.wait_closed()
+
+        _connected.clear()
+        metrics['reconnects'] += 1
+        print('Gateway connection closed, reconnecting')
+
+
+def _replay():
+    if _sent:
+        metrics['replayed'] += len(_sent)
+        _queue.extendleft(reversed(_sent))
+        _sent.clear()
+        _ready.set()
+
+def _load_spill():
+    global _spilled
+    if spill_path and os.path.exists(spill_path):
+        # left over from a previous process, sent before anything new.
+        with open(spill_path, 'rb') as f:
+            _spilled = sum(1 for _ in f)
+
+def _spill(frame: str):
+    global _spilled
+    # tiny appends, cheap enough to do from the event loop.
+    with open(spill_path, 'a', encoding='utf-8') as f:
+        f.write(frame + '\n')
+    _spilled += 1
+    metrics['spilled'] += 1
+
+def _unspill():
+    global _spilled, _spill_offset
+    with open(spill_path, 'r', encoding='utf-8') as f:
+        f.seek(_spill_offset)
+        while len(_queue) < queue_size and _spilled:
+            line = f.readline()
+            if not line:
+                _spilled = 0
+                break
+            _queue.append(line.rstrip('\n'))
+            _spilled -= 1
+        _spill_offset = f.tell()
+
+    if _spilled == 0:
+        os.remove(spill_path)
+        _spill_offset = 0
+
+async def _enqueue(frame: dict):
+    global _seq
+    _seq += 1
+    frame['o'] = origin
+    frame['s'] = _seq
+    # encoded right away, routes keep using (and mutating) the event data.
+    frame = dumps(frame).decode()
+
+    # once anything is on disk, everything newer goes there too to keep order.
+    if spill_path and (_spilled or len(_queue) >= queue_size):
+        _spill(frame)
+        _ready.set()
+        return
+
+    if len(_queue) >= queue_size:
+        if overflow == 'block':
+            while len(_queue) >= queue_size:
+                _space.clear()
+                await _space.wait()
+        elif overflow == 'drop_newest':
+            metrics['dropped'] += 1
+            return
+        else:
+            _queue.popleft()
+            metrics['dropped'] += 1
+
+    _queue.append(frame)
+    metrics['queued'] += 1
+    metrics['max_depth'] = max(metrics['max_depth'], len(_queue))
+    _ready.set()
+
+async def _writer():
+    while True:
+        if not _queue and _spilled:
+            _unspill()
+
+        if not _queue:
+            _ready.clear()
+            await _ready.wait()
+            continue
+
+        await _connected.wait()
+
+        if len(_queue) < batch_size and batch_linger:
+            await sleep(batch_linger)
+
+        batch = [_queue.popleft() for _ in range(min(batch_size, len(_queue)))]
+        _space.set()
+
+        frame = batch[0] if len(batch) == 1 else '{"t": "BATCH", "d": [' + ', '.join(batch) + ']}'
+        start = time.perf_counter()
+
+        try:
+            await ws.send(frame)
+        except Exception:
+            # connection dropped, keep the events for after the reconnect.
+            _queue.extendleft(reversed(batch))
+            metrics['failed_sends'] += 1
+            if ws.closed:
+                _connected.clear()
+            else:
+                await sleep(1)
+            continue
+
+        elapsed = time.perf_counter() - start
+        _sent.extend(batch)
+        metrics['sent'] += len(batch)
+        metrics['batches'] += 1
+        metrics['send_seconds_total'] += elapsed
+        metrics['send_seconds_max'] = max(metrics['send_seconds_max'], elapsed)
 
 
 async def dispatch_event(event_name: str, event_data: dict):
     d = {'t': 'DISPATCH', 'd': {'name': event_name.upper(), 'data': event_data}}
-    await ws.send(json.dumps(d))
+    await _enqueue(d)
 
 
 async def dispatch_event_to(user_id: int, event_name: str, event_data: dict):
@@ -47,7 +223,7 @@ async def dispatch_event_to(user_id: int, event_name: str, event_data: dict):
         't': 'DISPATCH_TO',
         'd': {'event_name': event_name.upper(), 'data': event_data, 'user': user_id},
     }
-    await ws.send(json.dumps(d))
+    await _enqueue(d)
 
 
 async def guild_dispatch(guild_id: int, event_name: str, event_data: dict):
@@ -55,9 +231,15 @@ async def guild_dispatch(guild_id: int, event_name: str, event_data: dict):
         't': 'DISPATCH_TO_GUILD',
         'd': {'guild_id': guild_id, 'event_name': event_name, 'data': event_data},
     }
-    await ws.send(json.dumps(d))
+    await _enqueue(d)
 
 
 async def send_notification(type: str, excerpt: dict, user_id: int):
     d = {'t': 'NOTIFICATION', 'type': str(type), 'excerpt': excerpt, '_id': user_id}
-    await ws.send(json.dumps(d))
+    await _enqueue(d)
+
+
+async def send_bulk_notification(type: str, excerpt: dict, user_ids: list):
+    # one frame (and one copy of the excerpt) for every recipient.
+    d = {'t': 'NOTIFICATION_BULK', 'type': str(type), 'excerpt': excerpt, '_ids': user_ids}
+    await _enqueue(d)
@@ -0,0 +1,173 @@
+# attributes every mongo command to the request that issued it.
+#
+# commands are always counted (the access log reports them). with
+# `db_instrumentation=1` each one is also timed and sized, routes get running
+# aggregates (served by /metrics), requests over `db_command_warn` commands are
+# logged with a breakdown of what repeated, filters no manifest index can
+# serve are logged once per shape, and `server_timing=1` adds a Server-Timing
+# header to every response.
+import contextvars
+import logging
+import os
+import time
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import bson
+from pymongo import monitoring
+
+server_timing = os.getenv('server_timing') == '1'
+enabled = os.getenv('db_instrumentation') == '1' or server_timing
+command_warn = int(os.getenv('db_command_warn', 20))
+
+_log = logging.getLogger(__name__)
+
+# commands whose body names the collection and carries a filter.
+_filters = {
+    'find': lambda c: c.get('filter'),
+    'count': lambda c: c.get('query'),
+    'distinct': lambda c: c.get('query'),
+    'findAndModify': lambda c: c.get('query'),
+    'update': lambda c: c['updates'][0].get('q') if c.get('updates') else None,
+    'delete': lambda c: c['deletes'][0].get('q') if c.get('deletes') else None,
+    'aggregate': lambda c: next((s['$match'] for s in c.get('pipeline', ()) if '$match' in s), None),
+}
+
+
+class Command:
+    __slots__ = ('name', 'collection', 'duration', 'reply_size')
+
+    def __init__(self, name: str, collection: str, duration: float, reply_size: int):
+        self.name = name
+        self.collection = collection
+        self.duration = duration
+        self.reply_size = reply_size
+
+
+class Request:
+    __slots__ = ('start', 'db_calls', 'commands', '_pending')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.db_calls = 0
+        self.commands: List[Command] = []
+        self._pending: Dict[int, Tuple[str, str]] = {}
+
+
+# motor runs commands on its executor with a copy of the caller's context, the
+# copy still points to the same Request so recording from there works.
+_current: contextvars.ContextVar[Optional[Request]] = contextvars.ContextVar('instrumented_request', default=None)
+
+# (database, collection) -> leading field of every index it has.
+_manifest: Dict[Tuple[str, str], Set[str]] = {}
+_reported: Set[tuple] = set()
+routes: Dict[str, dict] = {}
+
+
+def register_manifest(entries: Iterable[Tuple[str, str, Iterable[tuple]]]):
+    for database, collection, keys in entries:
+        _manifest.setdefault((database, collection), {'_id'}).update(k[0][0] for k in keys)
+
+def _fields(query: dict) -> Set[str]:
+    fields = set()
+
+    for k, v in query.items():
+        if k in ('$or', '$and'):
+            for branch in v:
+                fields |= _fields(branch)
+        elif not k.startswith('$'):
+            fields.add(k)
+
+    return fields
+
+def _check_filter(database: str, collection: str, query: Optional[dict]):
+    leading = _manifest.get((database, collection))
+
+    # collections outside of the manifest (per-channel messages) only have _id.
+    if not query or leading is None:
+        return
+
+    fields = _fields(query)
+
+    if fields & leading:
+        return
+
+    shape = (database, collection, tuple(sorted(fields)))
+
+    if shape not in _reported:
+        _reported.add(shape)
+        _log.warning('no manifest index serves %s.%s filtering on %s', database, collection, ', '.join(shape[2]))
+
+
+class _Listener(monitoring.CommandListener):
+    def started(self, event):
+        r = _current.get()
+
+        if r is None:
+            return
+
+        r.db_calls += 1
+
+        if enabled:
+            name = event.command_name
+            collection = event.command.get(name) if name in _filters else None
+
+            if isinstance(collection, str):
+                _check_filter(event.database_name, collection, _filters[name](event.command))
+
+            r._pending[event.request_id] = (name, collection)
+
+    def succeeded(self, event):
+        self._finish(event, len(bson.encode(event.reply)) if enabled else 0)
+
+    def failed(self, event):
+        self._finish(event, 0)
+
+    def _finish(self, event, reply_size: int):
+        r = _current.get()
+
+        if r is None or not enabled:
+            return
+
+        name, collection = r._pending.pop(event.request_id, (event.command_name, None))
+        r.commands.append(Command(name, collection, event.duration_micros / 1000, reply_size))
+
+listener = _Listener()
+
+
+def begin():
+    _current.set(Request())
+
+def current() -> Optional[Request]:
+    return _current.get()
+
+def finish(endpoint: str, response):
+    r = _current.get()
+
+    if r is None or not enabled or endpoint is None:
+        return
+
+    db_ms = sum(c.duration for c in r.commands)
+    total_ms = (time.perf_counter() - r.start) * 1000
+
+    route = routes.get(endpoint)
+
+    if route is None:
+        route = routes[endpoint] = {'requests': 0, 'commands': 0, 'db_ms': 0.0, 'reply_bytes': 0, 'max_commands': 0}
+
+    route['requests'] += 1
+    route['commands'] += r.db_calls
+    route['db_ms'] += db_ms
+    route['reply_bytes'] += sum(c.reply_size for c in r.commands)
+    route['max_commands'] = max(route['max_commands'], r.db_calls)
+
+    if r.db_calls > command_warn:
+        repeated = Counter(f'{c.name} {c.collection}' for c in r.commands).most_common(3)
+        _log.warning(
+            '%s issued %d commands, most repeated: %s',
+            endpoint, r.db_calls, ', '.join(f'{k} x{n}' for k, n in repeated),
+        )
+
+    if server_timing:
+        response.headers['Server-Timing'] = (
+            f'db;dur={db_ms:.2f};desc="{r.db_calls} commands", app;dur={max(total_ms - db_ms, 0):.2f}'
+        )
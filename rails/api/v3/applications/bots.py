@@ -1,9 +1,11 @@
 import quart
-import json
 import datetime
 from quart import Blueprint, request
+from ...encoding import respond
 from ..data_bodys import error_bodys
-from ..database import users, user_settings
+from ..checks import check_session_, invalidate_user
+from .. import repos
+from ..sessions import create_session, revoke_user_sessions
 from ..snowflakes import hash_from, snowflake
 from ..encrypt import get_hash_for
 
@@ -12,32 +14,22 @@ bots = Blueprint('bots-v3', __name__)
 
 @bots.post('')
 async def create_bot():
-    auth = request.headers.get('Authorization', '')
-
-    user = users.find_one({'session_ids': [auth]}) 
-
-    if user == None:
-        return quart.Response(error_bodys['no_auth'], 401)
+    user = await check_session_(request.headers.get('Authorization', ''))
 
     if user['bot']:
-        return quart.Response(error_bodys['no_perms'], 403)
+        return respond(error_bodys['no_perms'], 403)
 
     d: dict = await quart.request.get_json()
 
     if not isinstance(d['separator'], str):
-        return quart.Response(error_bodys['invalid_data'], status=400)
+        return respond(error_bodys['invalid_data'], 400)
 
     if len(d['separator']) != 4:
-        return quart.Response(body=error_bodys['invalid_data'], status=400)
+        return respond(error_bodys['invalid_data'], 400)
 
     if d['separator'] == '0000':
-        return quart.Response(error_bodys['invalid_data'], status=400)
+        return respond(error_bodys['invalid_data'], 400)
     
-    em = users.find_one({'email': d.get('email')})
-
-    if em != None:
-        return quart.Response(error_bodys['invalid_data'], status=400)
-
     _id = snowflake()
 
     try:
@@ -49,31 +41,29 @@ async def create_bot():
             'avatar_url': None,
             'banner_url': None,
             'flags': 1 << 2,
+            'verified': False,
             'system': False,
             'email_verified': True,
-            'session_ids': [get_hash_for(hash_from())],
             'blocked_users': [],
             'bot': True,
             'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat()
         }
     except KeyError:
-        return quart.Response(body=error_bodys['invalid_data'], status=400)
+        return respond(error_bodys['invalid_data'], 400)
     else:
-        r = quart.Response(json.dumps(given), status=201)
-        await user_settings.insert_one({'_id': _id, 'accept_friend_requests': False})
-        await users.insert_one(given)
-        return r
+        await repos.users.create(given, {'_id': _id, 'accept_friend_requests': False})
+        given['token'] = await create_session(_id, bot=True, token=get_hash_for(hash_from()))
+        return respond(given, 201)
 
 @bots.delete('/<bot_id>')
-async def delete_bot():
-    auth = request.headers.get('Authorization', '')
-
-    user = users.find_one({'session_ids': [auth]}) 
-
-    if user == None:
-        return quart.Response(error_bodys['no_auth'], 401)
+async def delete_bot(bot_id):
+    user = await check_session_(request.headers.get('Authorization', ''))
 
     if not user['bot']:
-        return quart.Response(error_bodys['no_perms'], 403)
+        return respond(error_bodys['no_perms'], 403)
+
+    await repos.users.delete(user['_id'])
+    await revoke_user_sessions(user['_id'])
+    invalidate_user(user['_id'])
 
-    await users.delete_one({'_id': user['_id']})
+    return respond(error_bodys['no_content'], 204)
@@ -1,21 +1,97 @@
+import os
+import asyncio
+import time
 import quart
-from .database import users, user_agent_tracking
+from collections import OrderedDict
+from typing import Dict, Tuple
+from .cache import TTLCache
+from .database import user_agent_tracking
 from .errors import Unauthorized
+from .sessions import resolve_session
+
+# resolved sessions are kept per-process, so a revoked token can still be
+# accepted by *other* workers until its entry expires; keep the ttl short.
+_sessions = TTLCache(
+    int(os.getenv('session_cache_size', 10000)),
+    float(os.getenv('session_cache_ttl', 30)),
+)
+_negative_ttl = float(os.getenv('session_cache_negative_ttl', 5))
+
+# a session is cached with the invalidation epoch read before its query, and
+# is only good while its user hasn't been invalidated since.
+_epoch = 0
+# user id -> (when, epoch) of their last invalidation, oldest first. a record
+# is dropped once every session cached before it has expired.
+_invalidated: 'OrderedDict[str, Tuple[float, int]]' = OrderedDict()
+_pending: Dict[str, asyncio.Task] = {}
+_missing = object()
+
+
+def _invalidated_after(user_id: str, epoch: int) -> bool:
+    record = _invalidated.get(user_id)
+    return record is not None and record[1] > epoch
+
+async def _lookup(session_id: str):
+    started, epoch = time.monotonic(), _epoch
+    user = await resolve_session(session_id)
+
+    if user == None:
+        _sessions.set(session_id, None, _negative_ttl)
+    # not when the user was invalidated while the query ran, or when it ran
+    # for so long that the record of that may be gone already.
+    elif not _invalidated_after(user['_id'], epoch) and time.monotonic() - started < _sessions.ttl:
+        _sessions.set(session_id, (epoch, user))
+
+    return user
 
 
 async def check_session_(session_id):
-    user = await users.find_one({'session_ids': [session_id]})
+    if not session_id:
+        raise Unauthorized('Invalid Authorization')
+
+    cached = _sessions.get(session_id, _missing)
+
+    if cached is None:
+        raise Unauthorized('Invalid Authorization')
+
+    if cached is not _missing and not _invalidated_after(cached[1]['_id'], cached[0]):
+        return dict(cached[1])
+
+    # coalesce concurrent lookups of the same token into one query.
+    task = _pending.get(session_id)
+
+    if task is None:
+        task = asyncio.get_running_loop().create_task(_lookup(session_id))
+        _pending[session_id] = task
+        task.add_done_callback(lambda _: _pending.pop(session_id, None))
+
+    user = await asyncio.shield(task)
 
     if user == None:
         raise Unauthorized('Invalid Authorization')
     else:
-        return user
+        # routes pop fields off of the user, never hand out the cached dict.
+        return dict(user)
+
+def invalidate_session(session_id: str):
+    _sessions.pop(session_id)
+
+def invalidate_user(user_id: str):
+    global _epoch
+    _epoch += 1
+    now = time.monotonic()
+
+    _invalidated.pop(user_id, None)
+    _invalidated[user_id] = (now, _epoch)
+
+    while now - next(iter(_invalidated.values()))[0] > _sessions.ttl:
+        _invalidated.popitem(last=False)
 
 async def log_user_agent(req: quart.Request):
     user_agent = req.headers.get('User-Agent', '')
     if user_agent in (None, ''):
         return
-    
+
     possible = await user_agent_tracking.find_one({'name': user_agent})
 
     if possible == None:
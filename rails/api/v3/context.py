@@ -0,0 +1,69 @@
+# everything a guild/channel route needs to authorize a request, loaded with
+# as few sequential round trips as the keys allow.
+import asyncio
+import dataclasses
+from typing import Optional
+from . import repos
+from .checks import check_session_
+from .errors import Forbidden, NotFound
+from .permissions import Permission, has, resolve
+from .snowflakes import parse_snowflake
+
+
+@dataclasses.dataclass(slots=True)
+class RequestContext:
+    user: dict
+    member: dict
+    guild: dict
+    permissions: int
+    channel: Optional[dict] = None
+
+    def can(self, flag: Permission) -> bool:
+        return has(self.permissions, flag)
+
+
+def _check(ctx: RequestContext, require: Permission):
+    if require is not None and not ctx.can(require):
+        raise Forbidden('Forbidden')
+
+    return ctx
+
+async def load_channel_context(auth: str, channel_id: str, require: Permission = None) -> RequestContext:
+    # the id picks a message collection (or bucket), it has to be a snowflake.
+    if parse_snowflake(channel_id) == None:
+        raise NotFound('Not Found')
+
+    # session and channel are independent, member and guild only need the channel.
+    user, channel = await asyncio.gather(check_session_(auth), repos.channels.get(channel_id))
+
+    if channel == None:
+        raise NotFound('Not Found')
+
+    member, guild = await asyncio.gather(
+        repos.members.get(channel['guild_id'], user['_id']), repos.guilds.get(channel['guild_id'])
+    )
+
+    if guild == None:
+        raise NotFound('Not Found')
+
+    if member == None:
+        raise Forbidden('Unauthorized')
+
+    ctx = RequestContext(user, member, guild, resolve(guild, member, channel), channel)
+
+    return _check(ctx, require)
+
+async def load_guild_context(auth: str, guild_id: str, require: Permission = None) -> RequestContext:
+    user, guild = await asyncio.gather(check_session_(auth), repos.guilds.get(guild_id))
+
+    if guild == None:
+        raise NotFound('Not Found')
+
+    member = await repos.members.get(guild_id, user['_id'])
+
+    if member == None:
+        raise Forbidden('Unauthorized')
+
+    ctx = RequestContext(user, member, guild, resolve(guild, member))
+
+    return _check(ctx, require)
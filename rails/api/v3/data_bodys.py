@@ -1,17 +1,18 @@
-import json
 import re
+from ..encoding import dumps
 
+# prebuilt once, responses send these bytes as they are.
 error_bodys = {
-    'no_auth': json.dumps({'message': "401: Unauthorized", 'code': 0, }),
-    'invalid_data': json.dumps({'message': '400: Bad Request', 'code': 0, }),
-    'not_in_guild': json.dumps({'message': '403: Unauthorized', 'code': 0, }),
-    'missing_perms': json.dumps({'message': '401: Unauthorized', 'code': 0, }),
-    'not_found': json.dumps({'message': '404: Not Found', 'code': 0,}),
-    'already_in_guild': json.dumps(
+    'no_auth': dumps({'message': "401: Unauthorized", 'code': 0, }),
+    'invalid_data': dumps({'message': '400: Bad Request', 'code': 0, }),
+    'not_in_guild': dumps({'message': '403: Unauthorized', 'code': 0, }),
+    'missing_perms': dumps({'message': '401: Unauthorized', 'code': 0, }),
+    'not_found': dumps({'message': '404: Not Found', 'code': 0,}),
+    'already_in_guild': dumps(
         {'message': '409: You are already in this guild', 'code': 0, }
     ),
-    'no_perms': json.dumps({'message': '403: Forbidden', 'code': 0,}),
-    'no_content': json.dumps({'message': '204: No Content', 'code': 0,}),
+    'no_perms': dumps({'message': '403: Forbidden', 'code': 0,}),
+    'no_content': dumps({'message': '204: No Content', 'code': 0,}),
 }
 
 mention = re.compile('<@*&*[0-9]+>')
@@ -22,3 +23,13 @@ def get_regexed_id(reg: str):
     o = reg[2:]
 
     return o[:-1]
+
+def get_mentions(content: str):
+    # unique user and role (<@&id>) ids mentioned in `content`.
+    users, roles = set(), set()
+
+    for m in mention.findall(content):
+        raw = m[1:-1]
+        (roles if '&' in raw else users).add(raw.lstrip('@&'))
+
+    return users, roles
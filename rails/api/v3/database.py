@@ -1,18 +1,41 @@
 # utils for using motor, made to make development easier, and faster.
 import asyncio
+import copy
+import datetime
 import pymongo
 import motor.core as motor
 import motor.motor_asyncio as motor_
 import dotenv
 import os
+from .cache import TTLCache
+from .group_commit import GroupCommit
+from .projections import projections
+# as a module, snowflakes imports this one too.
+from . import snowflakes
+from ..instrumentation import listener as command_listener
 
 dotenv.load_dotenv()
 
 
-loop = asyncio.new_event_loop()
-client: motor.AgnosticClient = motor_.AsyncIOMotorClient(
-    os.getenv('mongo_uri'), io_loop=loop
-)
+# importing this module must not touch the network or an event loop, every
+# worker serves on its own loop. until `bind` runs (from app.before_serving)
+# the client sits on a closed placeholder loop, so using it early fails loudly.
+_unbound = asyncio.new_event_loop()
+_unbound.close()
+
+if os.getenv('mongo_uri', '').startswith('mongomock://'):
+    # in-memory stand-in for the load harness, `pip install mongomock-motor`.
+    from mongomock_motor import AsyncMongoMockClient
+
+    client: motor.AgnosticClient = AsyncMongoMockClient()
+else:
+    client: motor.AgnosticClient = motor_.AsyncIOMotorClient(
+        os.getenv('mongo_uri'), io_loop=_unbound, connect=False, event_listeners=[command_listener]
+    )
+
+def bind(loop: asyncio.AbstractEventLoop = None):
+    # databases and collections ask the client for its loop on every call.
+    client.io_loop = loop or asyncio.get_running_loop()
 
 # databases.
 _users: motor.AgnosticDatabase = client.get_database(
@@ -53,6 +76,16 @@ guilds: motor.AgnosticCollection = _guilds.get_collection('core')
 
 guild_invites: motor.AgnosticCollection = _guilds.get_collection('invites')
 
+# read from the primary, a freshly created session has to resolve right away.
+sessions: motor.AgnosticCollection = _users.get_collection(
+    'sessions', read_preference=pymongo.ReadPreference.PRIMARY
+)
+
+# worker ids for snowflakes, see snowflakes.lease.
+snowflake_leases: motor.AgnosticCollection = _users.get_collection(
+    'snowflake-leases', read_preference=pymongo.ReadPreference.PRIMARY
+)
+
 user_interface: motor.AgnosticCollection = _users.get_collection('ui')
 
 user_agent_tracking: motor.AgnosticCollection = _users.get_collection('user-agents')
@@ -61,60 +94,199 @@ user_settings: motor.AgnosticCollection = _users.get_collection('settings')
 
 friends: motor.AgnosticCollection = _users.get_collection('friends')
 
-async def send_message(channel_id: str, data: dict):
-    col: motor.AgnosticCollection = _messages.get_collection(channel_id)
-    await col.create_index('content')
-    await col.create_index('created_at')
-    await col.create_index('channel_id')
+# read-through caches for documents that are read on nearly every request but
+# rarely written. repos.mongo calls the invalidate_* functions below on every
+# write, other workers only see a change once their own entry expires.
+_guild_cache = TTLCache(int(os.getenv('guild_cache_size', 5000)), float(os.getenv('guild_cache_ttl', 30)))
+_channel_cache = TTLCache(int(os.getenv('channel_cache_size', 20000)), float(os.getenv('channel_cache_ttl', 30)))
+_member_cache = TTLCache(int(os.getenv('member_cache_size', 50000)), float(os.getenv('member_cache_ttl', 30)))
+
+async def _read_through(cache: TTLCache, key, col: motor.AgnosticCollection, query: dict, projection: dict = None):
+    doc = cache.get(key)
+
+    if doc is None:
+        doc = await col.find_one(query, projection)
+
+        if doc == None:
+            return None
+
+        cache.set(key, doc)
+
+    # callers are free to change what they get back.
+    return copy.deepcopy(doc)
+
+async def get_guild(guild_id: str):
+    return await _read_through(_guild_cache, guild_id, guilds, {'_id': guild_id})
+
+async def get_channel(channel_id: str):
+    return await _read_through(_channel_cache, channel_id, channels, {'_id': channel_id})
+
+async def get_member(guild_id: str, user_id: str):
+    return await _read_through(
+        _member_cache, (guild_id, user_id), members, {'guild_id': guild_id, 'id': user_id}, projections['member']
+    )
+
+def invalidate_guild(guild_id: str):
+    _guild_cache.pop(guild_id)
+
+def invalidate_channel(channel_id: str):
+    _channel_cache.pop(channel_id)
 
+def invalidate_member(guild_id: str, user_id: str):
+    _member_cache.pop((guild_id, user_id))
+
+def forget_guild_channels(guild_id: str):
+    _channel_cache.pop_where(lambda _, channel: channel['guild_id'] == guild_id)
+
+def forget_guild_members(guild_id: str):
+    _member_cache.pop_where(lambda key, _: key[0] == guild_id)
+
+def cache_stats():
+    return {
+        'guilds': _guild_cache.stats(),
+        'channels': _channel_cache.stats(),
+        'members': _member_cache.stats(),
+    }
+
+# 'channel' keeps one collection per channel, 'bucketed' keeps every message in
+# `message_buckets` shared collections indexed on (channel_id, _id).
+message_storage = os.getenv('message_storage', 'channel')
+message_buckets = int(os.getenv('message_buckets', 1))
+# also read the per-channel collections while `migrations messages` is running.
+message_legacy_reads = os.getenv('message_legacy_reads', '0') == '1'
+
+# with `message_group_commit=1` concurrent sends share one insert_many per
+# collection, waiting at most `message_group_commit_wait_ms` for company.
+message_group_commit = os.getenv('message_group_commit', '0') == '1'
+message_writer = GroupCommit(
+    int(os.getenv('message_group_commit_max', 100)),
+    float(os.getenv('message_group_commit_wait_ms', 2)) / 1000,
+)
+
+def bucket_name(n: int) -> str:
+    return 'all' if message_buckets == 1 else f'bucket-{n}'
+
+_buckets = [_messages.get_collection(bucket_name(n)) for n in range(message_buckets)]
+# ids of messages deleted while legacy reads are on, so `migrations messages`
+# doesn't copy them back into a bucket.
+message_tombstones: motor.AgnosticCollection = _messages.get_collection('deleted')
+
+def _message_collection(channel_id: str) -> motor.AgnosticCollection:
+    if message_storage == 'bucketed':
+        return _buckets[int(channel_id) % message_buckets]
+
+    return _messages.get_collection(channel_id)
+
+def _falls_back() -> bool:
+    return message_storage == 'bucketed' and message_legacy_reads
+
+async def send_message(channel_id: str, data: dict):
+    col = _message_collection(channel_id)
+    # per-channel collections are only ever queried by _id, which needs no
+    # index of its own. created_at windows are _id ranges (snowflakes.id_range).
     data['channel_id'] = channel_id
 
-    await col.insert_one(data)
+    if message_group_commit:
+        await message_writer.insert(col, data)
+    else:
+        await col.insert_one(data)
 
 async def get_message(channel_id: str, message_id: str):
-    c: motor.AgnosticCursor = channels.find_one({'_id': channel_id})
+    col = _message_collection(channel_id)
 
-    if c == None:
-        return None
+    message = await col.find_one({'channel_id': channel_id, '_id': message_id})
 
-    col: motor.AgnosticCollection = _messages.get_collection(channel_id)
+    if message == None and _falls_back():
+        message = await _messages.get_collection(channel_id).find_one({'_id': message_id})
 
-    return await col.find_one({'channel_id': channel_id, '_id': message_id})
+    return message
 
-async def edit_message(channel_id: str, message_id: str, data: dict):
-    col: motor.AgnosticCollection = _messages.get_collection(channel_id)
+async def _message_range(col: motor.AgnosticCollection, query: dict, bounds: dict, direction: int, limit: int):
+    # one range scan per id length, in time order, until the page is full.
+    page = []
+    ranges = snowflakes.id_ranges(bounds)
 
-    return await col.update_one({'_id': message_id}, data)
+    for r in ranges if direction == 1 else ranges[::-1]:
+        if len(page) >= limit:
+            break
 
-async def delete_message(channel_id: str, message_id: str):
-    col: motor.AgnosticCollection = _messages.get_collection(channel_id)
+        n = limit - len(page)
+        page += await col.find({**query, '_id': r}).sort('_id', direction).limit(n).to_list(n)
+
+    return page
 
-    await col.delete_one({'_id': message_id})
+async def _message_page(channel_id: str, bounds: dict, direction: int, limit: int):
+    page = await _message_range(_message_collection(channel_id), {'channel_id': channel_id}, bounds, direction, limit)
 
-async def _init_indexes():
-    # guild-specific
+    if _falls_back():
+        legacy = await _message_range(_messages.get_collection(channel_id), {}, bounds, direction, limit)
+        # a message that was already copied is in both, the bucket's copy wins.
+        seen = {m['_id'] for m in page}
+        page = sorted(
+            page + [m for m in legacy if m['_id'] not in seen],
+            key=lambda m: snowflakes.id_key(m['_id']), reverse=direction == -1,
+        )[:limit]
 
-    await members.create_index('id')
-    await members.create_index('joined_at')
-    await members.create_index('owner')
-    await members.create_index('roles')
+    return page
 
-    await guild_invites.create_index('guild_id')
-    await guild_invites.create_index('code')
+async def get_messages(channel_id: str, before: str = None, after: str = None, around: str = None, limit: int = 50):
+    # newest first, every page is a range scan on (channel_id, _id).
+    if around:
+        older = await _message_page(channel_id, {'$lt': around}, -1, limit // 2)
+        newer = await _message_page(channel_id, {'$gte': around}, 1, limit - limit // 2)
+        return newer[::-1] + older
 
-    await guilds.create_index('name')
-    await guilds.create_index('created_at')
-    await guilds.create_index('owner')
+    if after:
+        return (await _message_page(channel_id, {'$gt': after}, 1, limit))[::-1]
 
-    # users
+    return await _message_page(channel_id, {'$lt': before} if before else {}, -1, limit)
 
-    await users.create_index('username')
-    await users.create_index('separator')
+async def edit_message(channel_id: str, message_id: str, data: dict):
+    col = _message_collection(channel_id)
 
-    await friends.create_index('other')
+    r = await col.update_one({'channel_id': channel_id, '_id': message_id}, data)
 
-    # direct messages
+    if r.matched_count == 0 and _falls_back():
+        r = await _messages.get_collection(channel_id).update_one({'_id': message_id}, data)
 
-    await normal_dm.create_index('users')
+    return r
 
-    await group_dm.create_index('users')
+async def delete_message(channel_id: str, message_id: str):
+    col = _message_collection(channel_id)
+
+    if _falls_back():
+        # the message can be in both collections, and a running migration may
+        # still copy it over. the tombstone goes first so it can't miss it.
+        await message_tombstones.update_one(
+            {'_id': message_id},
+            {'$set': {'channel_id': channel_id, 'deleted_at': datetime.datetime.now(datetime.timezone.utc)}},
+            upsert=True,
+        )
+        await _messages.get_collection(channel_id).delete_one({'_id': message_id})
+
+    await col.delete_one({'channel_id': channel_id, '_id': message_id})
+
+async def delete_channel_messages(channel_id: str):
+    if message_storage == 'bucketed':
+        await _message_collection(channel_id).delete_many({'channel_id': channel_id})
+
+    if message_storage == 'channel' or _falls_back():
+        await _messages.drop_collection(channel_id)
+
+async def guild_members(guild_id: str, after: str = None, limit: int = 0):
+    # range scans on (guild_id, id), one per id length, pages never skip.
+    sent = 0
+
+    for r in snowflakes.id_ranges({'$gt': after} if after else {}):
+        left = limit - sent if limit else 0
+        found = members.find(
+            {'guild_id': guild_id, 'id': r}, projections['member_summary'],
+            limit=left, batch_size=min(left or 500, 500),
+        ).sort('id', pymongo.ASCENDING)
+
+        async for member in found:
+            yield member
+            sent += 1
+
+        if limit and sent >= limit:
+            return
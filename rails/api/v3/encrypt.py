@@ -1,5 +1,67 @@
-from hashlib import sha384
+import asyncio
+import base64
+import hmac
+import os
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import scrypt, sha384
 
+# passwords go through scrypt. it's slow on purpose, so it runs on a small
+# thread pool (hashlib releases the gil while it works) and at most
+# `password_hash_concurrency` hashes are in flight per worker. a login burst
+# waits on the semaphore instead of starving every other request.
+scrypt_n = int(os.getenv('password_scrypt_n', 1 << 14))
+scrypt_r = int(os.getenv('password_scrypt_r', 8))
+scrypt_p = int(os.getenv('password_scrypt_p', 1))
+_concurrency = int(os.getenv('password_hash_concurrency', 2))
 
-def get_hash_for(password: str):
-    return sha384(password.encode()).hexdigest()
+_executor = ThreadPoolExecutor(max_workers=_concurrency, thread_name_prefix='password-hash')
+_slots = asyncio.Semaphore(_concurrency)
+
+
+def get_hash_for(value: str):
+    # emails and tokens, they are looked up by their hash so it can't be salted.
+    return sha384(value.encode()).hexdigest()
+
+def _b64(raw: bytes) -> str:
+    return base64.b64encode(raw).decode()
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    return scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r + (1 << 20), dklen=32)
+
+def _hash(password: str) -> str:
+    salt = os.urandom(16)
+    key = _scrypt(password, salt, scrypt_n, scrypt_r, scrypt_p)
+
+    return f'scrypt${scrypt_n}${scrypt_r}${scrypt_p}${_b64(salt)}${_b64(key)}'
+
+def _verify(password: str, stored: str):
+    # (matches, should be rehashed)
+    if not stored.startswith('scrypt$'):
+        # an unsalted sha384 from before scrypt.
+        return hmac.compare_digest(get_hash_for(password), stored), True
+
+    _, n, r, p, salt, key = stored.split('$')
+    n, r, p = int(n), int(r), int(p)
+    matches = hmac.compare_digest(_scrypt(password, base64.b64decode(salt), n, r, p), base64.b64decode(key))
+
+    return matches, (n, r, p) != (scrypt_n, scrypt_r, scrypt_p)
+
+async def _run(func, *args):
+    async with _slots:
+        return await asyncio.get_running_loop().run_in_executor(_executor, func, *args)
+
+async def hash_password(password: str) -> str:
+    return await _run(_hash, password)
+
+# checked against when there is no account, so a missing email takes as long
+# as a wrong password.
+_dummy = None
+
+async def verify_password(password: str, stored: str = None):
+    global _dummy
+
+    if stored is None and _dummy is None:
+        _dummy = await hash_password('')
+
+    matches, rehash = await _run(_verify, password, stored or _dummy)
+    return matches and stored is not None, rehash
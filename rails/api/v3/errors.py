@@ -1,11 +1,11 @@
-import json
+from ..encoding import dumps
 
 
 class Error(Exception):
     status_code = 500
 
     def _to_json(self):
-        return json.dumps({'message': f'{self.status_code}: {self.args[0]}', 'code': 0})
+        return dumps({'message': f'{self.status_code}: {self.args[0]}', 'code': 0})
 
 class Forbidden(Error):
     status_code = 403
@@ -18,3 +18,6 @@ class InvalidData(Error):
 
 class Unauthorized(Error):
     status_code = 401
+
+class ServiceUnavailable(Error):
+    status_code = 503
@@ -0,0 +1,128 @@
+# group commit for inserts. concurrent inserts into the same collection are
+# held for up to `max_wait` seconds (or until `max_docs` are waiting) and
+# written with one unordered insert_many. every caller still waits for its own
+# document and gets the error insert_one would have raised for it, so a
+# duplicate in a batch only fails the request that sent it.
+import asyncio
+import time
+from typing import Dict, List, Set, Tuple
+from pymongo.errors import BulkWriteError, DuplicateKeyError, WriteError
+
+_Item = Tuple[dict, asyncio.Future]
+
+
+def _write_error(error: dict) -> WriteError:
+    # what pymongo raises for the same error from insert_one.
+    if error.get('code') == 11000:
+        return DuplicateKeyError(error.get('errmsg'), 11000, error)
+
+    return WriteError(error.get('errmsg'), error.get('code'), error)
+
+
+class GroupCommit:
+    def __init__(self, max_docs: int, max_wait: float):
+        self.max_docs = max_docs
+        self.max_wait = max_wait
+        # collection name -> (collection, waiting documents, when the first one came in).
+        self._batches: Dict[str, Tuple[object, List[_Item], float]] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self._flushing: Set[asyncio.Task] = set()
+
+        self.flushes = 0
+        self.documents = 0
+        self.failed = 0
+        self.max_batch = 0
+        self.wait_ms = 0.0
+        self.flush_ms = 0.0
+        self.max_flush_ms = 0.0
+
+    async def insert(self, col, doc: dict):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        key = col.full_name
+        batch = self._batches.get(key)
+
+        if batch is None:
+            batch = self._batches[key] = (col, [], time.perf_counter())
+            self._timers[key] = loop.call_later(self.max_wait, self._flush, key)
+
+        batch[1].append((doc, future))
+
+        if len(batch[1]) >= self.max_docs:
+            self._flush(key)
+
+        # a cancelled caller can't take its document back, it's written anyway.
+        await future
+
+    def _flush(self, key: str):
+        timer = self._timers.pop(key, None)
+
+        if timer is not None:
+            timer.cancel()
+
+        batch = self._batches.pop(key, None)
+
+        if batch is None:
+            return
+
+        # the insert is counted against the request that filled or opened the batch.
+        task = asyncio.get_running_loop().create_task(self._write(*batch))
+        self._flushing.add(task)
+        task.add_done_callback(self._flushing.discard)
+
+    async def _write(self, col, items: List[_Item], opened: float):
+        start = time.perf_counter()
+        errors: Dict[int, Exception] = {}
+
+        try:
+            await col.insert_many([doc for doc, _ in items], ordered=False)
+        except BulkWriteError as e:
+            errors = {err['index']: _write_error(err) for err in e.details.get('writeErrors', ())}
+
+            # written, but not as durably as asked, nobody can count on theirs.
+            if e.details.get('writeConcernErrors'):
+                errors = {i: errors.get(i, e) for i in range(len(items))}
+        except Exception as e:
+            errors = {i: e for i in range(len(items))}
+
+        took = (time.perf_counter() - start) * 1000
+
+        self.flushes += 1
+        self.documents += len(items)
+        self.failed += len(errors)
+        self.max_batch = max(self.max_batch, len(items))
+        self.wait_ms += (start - opened) * 1000
+        self.flush_ms += took
+        self.max_flush_ms = max(self.max_flush_ms, took)
+
+        for i, (_, future) in enumerate(items):
+            if future.done():
+                continue
+
+            if i in errors:
+                future.set_exception(errors[i])
+            else:
+                future.set_result(None)
+
+    async def drain(self):
+        # writes whatever is still waiting, for shutdown.
+        for key in list(self._batches):
+            self._flush(key)
+
+        await asyncio.gather(*self._flushing, return_exceptions=True)
+
+    def stats(self):
+        flushes = self.flushes or 1
+
+        return {
+            'flushes': self.flushes,
+            'documents': self.documents,
+            'failed': self.failed,
+            'waiting': sum(len(b[1]) for b in self._batches.values()),
+            'mean_batch': self.documents / flushes,
+            'max_batch': self.max_batch,
+            # how long the first document of a batch waited for the flush to start.
+            'mean_wait_ms': self.wait_ms / flushes,
+            'mean_flush_ms': self.flush_ms / flushes,
+            'max_flush_ms': self.max_flush_ms,
+        }
@@ -1,13 +1,15 @@
 import quart
-import json
 
 from datetime import datetime, timezone
+from ...encoding import dumps, respond
 from ..checks import check_session_
 from ..data_bodys import error_bodys
-from ..database import guilds as guilds_db, channels, members, guild_invites
-from ..snowflakes import code, snowflake
+from .. import repos
+from ..projections import project
+from ..snowflakes import code, snowflake, parse_snowflake
 from ...gateway import dispatch_event_to, guild_dispatch
-from ..permissions import Permissions
+from ..context import load_guild_context
+from ..permissions import Permission, invalidate
 
 guilds = quart.Blueprint('guilds-v3', __name__)
 
@@ -16,10 +18,10 @@ guilds = quart.Blueprint('guilds-v3', __name__)
 async def create_guild():
     owner = await check_session_(quart.request.headers.get('Authorization'))
     if owner == None:
-        return quart.Response(error_bodys['no_auth'], 401)
+        return respond(error_bodys['no_auth'], 401)
 
     if owner['bot']:
-        return quart.Response(error_bodys['no_perms'], 403)
+        return respond(error_bodys['no_perms'], 403)
 
     d: dict = await quart.request.get_json()
     id = snowflake()
@@ -53,7 +55,7 @@ async def create_guild():
             )
         }
     except KeyError:
-        return quart.Response(error_bodys['invalid_data'], 400)
+        return respond(error_bodys['invalid_data'], 400)
 
     old = req.copy()
     cat_id = snowflake()
@@ -82,7 +84,7 @@ async def create_guild():
     }
     first_joined = {
         'id': owner['_id'],
-        'user': owner,
+        'user': project(owner, 'public_user'),
         'nick': None,
         'avatar_url': None,
         'banner_url': None,
@@ -93,129 +95,109 @@ async def create_guild():
         'guild_id': id,
         'roles': [],
     }
-    await members.insert_one(first_joined)
-    await guilds_db.insert_one(req)
-    await channels.insert_many([cat, default_channels])
+    await repos.members.create(first_joined)
+    await repos.guilds.create(req)
+    await repos.channels.create_many([cat, default_channels])
 
     await dispatch_event_to(owner['_id'], 'GUILD_CREATE', old)
 
-    return quart.Response(json.dumps(old), 201)
+    return respond(old, 201)
 
 
 @guilds.patch('/<guild_id>')
 async def edit_guild(guild_id: int):
-    user = await check_session_(quart.request.headers.get('Authorization'))
-    if user == None:
-        return quart.Response(error_bodys['no_auth'], 401)
-
-    member = await members.find_one(user['id'])
-
-    if member == None:
-        return quart.Response(error_bodys['no_auth'], 401)
-
-    guild = await guilds_db.find_one({'_id': guild_id})
-
-    if guild == None:
-        return quart.Response(error_bodys['not_found'], 404)
-
-    allow = False
-
-    if member['roles'] == []:
-        p = guild['default_permission']
-    else:
-        p = member['roles'][0]['permissions']
-
-    v = Permissions(p)
-
-    if v.manage_guild is True or member['owner'] is True:
-        allow = True
-
-    # incorrect permissions
-    if allow is False:
-        return quart.Response(error_bodys['no_perms'], 403)
+    ctx = await load_guild_context(quart.request.headers.get('Authorization'), guild_id, Permission.manage_guild)
+    guild = ctx.guild
 
-    json: dict = await quart.request.get_json()
+    body: dict = await quart.request.get_json()
 
     data = {}
 
-    if json.get('name'):
-        data['name'] = json.pop('name')
+    if body.get('name'):
+        data['name'] = body.pop('name')
 
-    if json.get('description'):
-        data['description'] = json.pop('name')
+    if body.get('description'):
+        data['description'] = body.pop('description')
+
+    if data == {}:
+        return respond(error_bodys['invalid_data'], 400)
 
     d = data.copy()
 
-    await guilds_db.update_one({'_id': guild_id}, data)
+    await repos.guilds.update(guild_id, data)
+    invalidate(guild_id)
 
     await guild_dispatch(guild['_id'], 'GUILD_UPDATE', d)
 
-    return quart.Response(d, 200)
+    return respond(d, 200)
 
 
 @guilds.delete('/<guild_id>')
 async def delete_guild(guild_id: int):
-    user = await check_session_(quart.request.headers.get('Authorization'))
-    if user == None:
-        return quart.Response(error_bodys['no_auth'], 401)
-
-    member = await members.find_one(user['id'])
-
-    if member == None:
-        return quart.Response(error_bodys['no_auth'], 401)
-
-    guild = await guilds_db.find_one({'_id': guild_id})
+    ctx = await load_guild_context(quart.request.headers.get('Authorization'), guild_id)
+    guild = ctx.guild
 
-    if guild == None:
-        return quart.Response(error_bodys['not_found'], 404)
-
-    if member['owner'] is False:
-        return quart.Response(error_bodys['no_perms'], 403)
+    if ctx.member['owner'] is False:
+        return respond(error_bodys['no_perms'], 403)
 
-    await guilds_db.delete_one({'_id': guild_id})
-    await members.delete_many({'guild_id': guild_id})
-    await channels.delete_many({'guild_id': guild_id})
+    # a deleted guild takes its channels and members with it.
+    await repos.guilds.delete(guild_id)
+    await repos.members.delete_all(guild_id)
+    await repos.channels.delete_all(guild_id)
+    invalidate(guild_id)
 
     await guild_dispatch(guild['_id'], 'GUILD_DELETE', None)
 
-    return quart.Response(error_bodys['no_content'], 204)
+    return respond(error_bodys['no_content'], 204)
 
 
 @guilds.get('/<guild_id>')
 async def get_guild(guild_id):
-    user = await check_session_(quart.request.headers.get('Authorization'))
-    if user == None:
-        return quart.Response(error_bodys['no_auth'], 401)
+    ctx = await load_guild_context(quart.request.headers.get('Authorization'), guild_id)
+
+    return respond(ctx.guild, 200)
+
 
-    member = await members.find_one(user['id'])
+@guilds.get('/<guild_id>/members')
+async def get_guild_members(guild_id):
+    await load_guild_context(quart.request.headers.get('Authorization'), guild_id)
 
-    if member == None:
-        return quart.Response(error_bodys['no_auth'], 401)
+    args = quart.request.args
+    after = parse_snowflake(args['after']) if args.get('after') else None
 
-    guild = await guilds_db.find_one({'_id': guild_id})
+    if args.get('after') and after == None:
+        return respond(error_bodys['invalid_data'], 400)
 
-    if guild == None:
-        return quart.Response(error_bodys['not_found'], 404)
+    # the whole guild, sent as it comes off the cursor.
+    if args.get('stream') == '1':
+        return quart.Response(_stream_members(repos.members.page(guild_id, after)), 200, content_type='application/json')
 
-    return quart.Response(json.dumps(guild), 200)
+    try:
+        limit = int(args.get('limit', 100))
+    except ValueError:
+        return respond(error_bodys['invalid_data'], 400)
 
+    if not 1 <= limit <= 1000:
+        return respond(error_bodys['invalid_data'], 400)
 
-@guilds.get('/<guild_id>/members')
-async def get_guild_members(guild_id):
-    user = await check_session_(quart.request.headers.get('Authorization'))
-    if user == None:
-        return quart.Response(error_bodys['no_auth'], 401)
+    ret = [_obj async for _obj in repos.members.page(guild_id, after, limit)]
+
+    return respond(ret, 200)
 
-    objs = members.find({'guild_id': guild_id})
 
-    ret = []
+async def _stream_members(objs, chunk_size: int = 100):
+    chunk = []
+    sep = b'['
 
     async for _obj in objs:
-        _obj.pop('guild_id')
-        _obj['user'].pop('session_ids')
-        ret.append(_obj)
+        chunk.append(dumps(_obj))
 
-    return quart.Response(json.dumps(ret), 200)
+        if len(chunk) == chunk_size:
+            yield sep + b','.join(chunk)
+            sep = b','
+            chunk = []
+
+    yield sep + b','.join(chunk) + b']' if chunk else (b'[]' if sep == b'[' else b']')
 
 
 @guilds.post('/invites/<invite_str>')
@@ -224,41 +206,38 @@ async def join_guild(invite_str):
     user = await check_session_(quart.request.headers.get('Authorization'))
 
     if user == None:
-        return quart.Response(error_bodys['no_auth'], 401)
+        return respond(error_bodys['no_auth'], 401)
 
     if user['bot']:
-        return quart.Response(error_bodys['no_perms'], 403)
+        return respond(error_bodys['no_perms'], 403)
 
-    invite = await guild_invites.find_one({'code': invite_str})
+    invite = await repos.invites.get(invite_str)
 
     if invite == None:
-        return quart.Response(error_bodys['not_found'], 404)
+        return respond(error_bodys['not_found'], 404)
 
-    c = await members.find_one({'guild_id': invite['guild_id'], 'id': user['_id']})
+    c = await repos.members.get(invite['guild_id'], user['_id'])
 
     if c != None:
-        return quart.Response(error_bodys['already_in_guild'], 409)
+        return respond(error_bodys['already_in_guild'], 409)
 
     member = {
-        '_id': user['_id'],
-        'user': user,
+        'id': user['_id'],
+        'user': project(user, 'public_user'),
         'nick': None,
         'avatar_url': None,
         'banner_url': None,
         'joined_at': datetime.now(timezone.utc).isoformat(),
         'deaf': False,
         'mute': False,
-        'permissions': [],
-        'guild_id': id,
+        'owner': False,
+        'guild_id': invite['guild_id'],
         'roles': [],
     }
-    ret = member.copy()
-    ret.pop('guild_id')
-    ret['user'].pop('session_ids')
-    dis = member.copy()
-    dis.pop('guild_id')
-    dis['user'].pop('session_ids')
-    await members.insert_one(member)
+    ret = project(member, 'member_summary')
+    dis = project(member, 'member_summary')
+    await repos.members.create(member)
+    invalidate(invite['guild_id'])
 
     await guild_dispatch(
         invite['guild_id'],
@@ -266,62 +245,31 @@ async def join_guild(invite_str):
         {'member': dis, 'guild_id': invite['guild_id']},
     )
 
-    return quart.Response(json.dumps(ret), 200)
+    return respond(ret, 200)
 
 
 @guilds.get('/<guild_id>/preview')
 async def get_guild_preview(guild_id):
-    guild = await guilds_db.find_one({'_id': guild_id})
+    guild = await repos.guilds.preview(guild_id)
 
     if guild == None:
-        return quart.Response(error_bodys['not_found'], 404)
-
-    cs = []
+        return respond(error_bodys['not_found'], 404)
 
-    async for channel in channels.find({'guild_id': guild_id}):
-        channel.pop('guild_id')
-        cs.append(channel)
+    guild['channels'] = await repos.channels.previews(guild_id)
 
-    guild['channels'] = cs
-
-    return quart.Response(json.dumps(guild), 200)
+    return respond(guild, 200)
 
 
 @guilds.post('/<guild_id>/invites')
 async def create_invite(guild_id):
-    user = await check_session_(quart.request.headers.get('Authorization'))
-
-    if user == None:
-        return quart.Response(error_bodys['no_auth'], 401)
-
-    c = await members.find_one({'guild_id': guild_id, 'id': user['_id']})
-
-    if c == None:
-        return quart.Response(error_bodys['not_in_guild'], 403)
-
-    guild = await guilds_db.find_one({'_id': guild_id})
-
-    allow = False
-
-    if c['roles'] == []:
-        v = guild['default_permission']
-    else:
-        v = c['roles'][0]['permissions']
-
-    p = Permissions(v)
-
-    if p.create_invites is True:
-        allow = True
-
-    if allow is False and c['owner'] is False:
-        return quart.Response(error_bodys['no_auth'], 401)
+    await load_guild_context(quart.request.headers.get('Authorization'), guild_id, Permission.create_invites)
 
-    code_ = await code()
+    code_ = str(code())
 
-    await guild_invites.insert_one({'guild_id': guild_id, 'code': code_})
+    await repos.invites.create(guild_id, code_)
 
     await guild_dispatch(
         guild_id, 'INVITE_CREATE', {'code': code_, 'guild_id': guild_id}
     )
 
-    return quart.Response(json.dumps({'code': code_}), 201)
+    return respond({'code': code_}, 201)
@@ -1,13 +1,15 @@
-import json
 import datetime
-from quart import Blueprint, Response, request
+from quart import Blueprint, request
 
-from ..snowflakes import snowflake
-from ..database import channels, users, send_message, get_message as find_message, members, guilds, delete_message as remove_message, edit_message as message_edit
+from ...encoding import respond
+from ..snowflakes import snowflake, parse_snowflake
+from ..context import load_channel_context
+from .. import repos
+from ..projections import project
 from ..data_bodys import error_bodys as err
-from ..permissions import Permissions
-from ..data_bodys import mention, get_regexed_id
-from ...gateway import send_notification, guild_dispatch
+from ..permissions import Permission
+from ..data_bodys import get_mentions
+from ...gateway import send_bulk_notification, guild_dispatch
 
 msgs = Blueprint('messages-v3', __name__)
 
@@ -46,14 +48,14 @@ def _verify_embed(d: dict):
         else:
             ret['color'] = d.pop('color')
     if d.get('fields'):
-        if not isinstance(d.get('fields'), list[dict]):
+        if not isinstance(d.get('fields'), list):
             pass
         else:
             for f in d.pop('fields'):
-                if not f.get('name') or not f.get('value'):
+                if not isinstance(f, dict) or not f.get('name') or not f.get('value'):
                     pass
                 else:
-                    ret['fields'].append({'name': d.pop('name'), 'value': d.pop('value')})
+                    ret['fields'].append({'name': f['name'], 'value': f['value']})
     if d.get('author'):
         if not isinstance(d.get('author'), dict):
             pass
@@ -76,56 +78,25 @@ def _verify_embed(d: dict):
 
 @msgs.post('/<channel_id>/messages/create')
 async def create_message(channel_id):
-    auth = request.headers.get('Authorization', '')
-    user = await users.find_one({'session_ids': [auth]})
+    ctx = await load_channel_context(request.headers.get('Authorization', ''), channel_id, Permission.send_messages)
+    user, member, guild = ctx.user, ctx.member, ctx.guild
 
-    if user == None:
-        return Response(err['no_auth'], 401)
-
-    channel = await channels.find_one({'_id': channel_id})
-
-    if channel == None:
-        return Response(err['not_found'], 404)
-
-    if channel['type'] == 1:
-        return Response(err['invalid_data'], 400)
-
-    member = await members.find_one({'id': user['_id'], 'guild_id': channel['guild_id']})
-
-    if member == None:
-        return Response(err['not_found'], 404)
-
-    guild = await guilds.find_one({'_id': channel['guild_id']})
-
-    if member['roles'] == []:
-        v = guild['default_permission']
-    else:
-        v = member['roles'][0]['permissions']
-
-    p = Permissions(v)
-
-    if not p.send_messages and not member['owner']:
-        return Response(err['no_perms'], 403)
+    if ctx.channel['type'] == 1:
+        return respond(err['invalid_data'], 400)
 
     d: dict = await request.get_json()
 
-    member['user'].pop('session_ids')
-    member['user'].pop('email')
-    member['user'].pop('password')
-    member['user'].pop('email_verified')
-    member['user'].pop('blocked_users')
-    member.pop('_id')
-    member['_id'] = member['id']
-    member.pop('id')
-    member.pop('guild_id')
+    author = project(member, 'message_author')
+    author['_id'] = author.pop('id')
 
     data = {
         '_id': snowflake(),
-        'author': member,
+        'author': author,
         'content': '',
         'tts': False,
         'embeds': [],
         'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'channel_id': channel_id,
     }
 
     if d.get('content'):
@@ -135,10 +106,10 @@ async def create_message(channel_id):
         if isinstance(d.get('tts'), bool):
             data['tts'] = d.pop('tts')
         else:
-            return Response(err['invalid_data'], 400)
+            return respond(err['invalid_data'], 400)
         
     if d.get('embeds'):
-        if isinstance(d.get('embeds'), list[dict]):
+        if isinstance(d.get('embeds'), list):
             embeds = []
             for embed in d.pop('embeds'):
                 if isinstance(embed, dict):
@@ -151,163 +122,124 @@ async def create_message(channel_id):
 
             for r in embeds:
                 if r == None:
-                    return Response(err['invalid_data'], 400)
+                    return respond(err['invalid_data'], 400)
 
             data['embeds'] = embeds
         else:
-            return Response(err['invalid_data'], 400)
+            return respond(err['invalid_data'], 400)
 
     if len(data['content']) > 5000:
-        return Response(err['invalid_data'], 400)
+        return respond(err['invalid_data'], 400)
 
-    await send_message(channel_id=channel_id, data=data)
+    await repos.messages.create(channel_id, data)
 
     await guild_dispatch(guild['_id'], 'MESSAGE_CREATE', data)
 
-    mentions = mention.findall(data['content'])
+    user_ids, role_ids = get_mentions(data['content'])
+    # the author and anyone who blocked them aren't notified.
+    mentioned = [i for i in await repos.members.mentioned(guild['_id'], user_ids, role_ids) if i != user['_id']]
+    recipients = await repos.users.not_blocking(mentioned, user['_id'])
 
-    # prevent spam pings
-    _last_ids = []
+    if recipients:
+        excerpt = {
+            '_id': data['_id'],
+            'channel_id': channel_id,
+            'guild_id': guild['_id'],
+            'author_id': user['_id'],
+            'content': data['content'][:200],
+            'created_at': data['created_at'],
+        }
+        await send_bulk_notification('MENTION', excerpt, recipients)
 
-    for m in mentions:
-        id = get_regexed_id(m)
-        if id in _last_ids:
-            pass
-        else:
-            _last_ids.append(id)
-            await send_notification('MENTION', data, id)
-    
-    del _last_ids
-
-    return Response(json.dumps(data), 201)
+    return respond(data, 201)
 
 @msgs.patch('/<channel_id>/messages/<message_id>')
 async def edit_message(channel_id, message_id):
-    auth = request.headers.get('Authorization', '')
-    user = await users.find_one({'session_ids': [auth]})
-
-    if user == None:
-        return Response(err['no_auth'], 401)
-
-    channel = channels.find_one({'_id': channel_id})
+    ctx = await load_channel_context(request.headers.get('Authorization', ''), channel_id)
+    channel = ctx.channel
 
-    if channel == None:
-        return Response(err['not_found'], 404)
-
-    member = await members.find_one({'_id': user['_id'], 'guild_id': channel['guild_id']})
-
-    if member == None:
-        return Response(err['no_perms'], 403)
-
-    message = await find_message(channel['id'], message_id)
+    message = await repos.messages.get(channel['_id'], message_id)
 
     if message == None:
-        return Response(err['not_found'], 404)
+        return respond(err['not_found'], 404)
 
-    if message['author'] != member:
-        return Response(err['no_perms'], 403)
+    if message['author']['_id'] != ctx.user['_id']:
+        return respond(err['no_perms'], 403)
 
-    edited_ms = await message_edit(channel['id'], message['id'])
-    await guild_dispatch(channel['guild_id'], 'MESSAGE_EDIT', message)
+    d: dict = await request.get_json()
 
-    return Response(json.dumps(edited_ms.raw_result))
+    if not isinstance(d.get('content'), str) or len(d['content']) > 5000:
+        return respond(err['invalid_data'], 400)
 
-@msgs.get('/<channel_id>/messages/<message_id>')
-async def get_message(channel_id, message_id):
-    auth = request.headers.get('Authorization', '')
-    user = await users.find_one({'session_ids': [auth]})
+    message['content'] = d['content']
+    message['edited_at'] = datetime.datetime.now(datetime.timezone.utc).isoformat()
 
-    if user == None:
-        return Response(err['no_auth'], 401)
+    await repos.messages.edit(
+        channel['_id'],
+        message['_id'],
+        {'content': message['content'], 'edited_at': message['edited_at']},
+    )
+    await guild_dispatch(channel['guild_id'], 'MESSAGE_EDIT', message)
 
-    channel = await channels.find_one({'_id': channel_id})
+    return respond(message)
 
-    if channel == None:
-        return Response(err['not_found'], 404)
+@msgs.get('/<channel_id>/messages')
+async def get_messages(channel_id):
+    cursors = {k: request.args.get(k) for k in ('before', 'after', 'around') if request.args.get(k)}
 
-    member = await members.find_one({'id': user['_id'], 'guild_id': channel['guild_id']})
+    if len(cursors) > 1:
+        return respond(err['invalid_data'], 400)
 
-    if member == None:
-        return Response(err['not_found'], 404)
+    for k, v in cursors.items():
+        cursors[k] = parse_snowflake(v)
 
-    guild = await members.find_one({'id': channel['guild_id']})
+        if cursors[k] == None:
+            return respond(err['invalid_data'], 400)
 
-    if member['roles'] == []:
-        v = guild['default_permission']
-    else:
-        v = member['roles'][0]['permissions']
+    try:
+        limit = int(request.args.get('limit', 50))
+    except ValueError:
+        return respond(err['invalid_data'], 400)
 
-    p = Permissions(v)
+    if not 1 <= limit <= 100:
+        return respond(err['invalid_data'], 400)
 
-    gtg = False
+    # checked once for the whole page.
+    ctx = await load_channel_context(
+        request.headers.get('Authorization', ''), channel_id, Permission.read_message_history
+    )
 
-    if p.read_message_history:
-        gtg = True
+    ms = await repos.messages.page(ctx.channel['_id'], limit=limit, **cursors)
 
-    for b in channel['bypass']:
-        if user['_id'] == b['_id']:
-            v = Permissions(b['value'])
-            if v.read_message_history:
-                gtg = True
-            else:
-                gtg = False
+    return respond(ms, 200)
 
-    if member['owner']:
-        gtg = True
-
-    if gtg is False:
-        return Response(err['no_perms'], 403)
+@msgs.get('/<channel_id>/messages/<message_id>')
+async def get_message(channel_id, message_id):
+    ctx = await load_channel_context(
+        request.headers.get('Authorization', ''), channel_id, Permission.read_message_history
+    )
 
-    ms = await find_message(channel_id, message_id)
+    ms = await repos.messages.get(ctx.channel['_id'], message_id)
 
     if ms == None:
-        return Response(err['not_found'], 404)
+        return respond(err['not_found'], 404)
 
-    return Response(json.dumps(ms), 200)
+    return respond(ms, 200)
 
 @msgs.delete('/<channel_id>/messages/<message_id>')
 async def delete_message(channel_id, message_id):
-    auth = request.headers.get('Authorization', '')
-    user = await users.find_one({'session_ids': [auth]})
-
-    if user == None:
-        return Response(err['no_auth'], 401)
+    ctx = await load_channel_context(
+        request.headers.get('Authorization', ''), channel_id, Permission.manage_messages
+    )
+    channel = ctx.channel
 
-    channel = await channels.find_one({'_id': channel_id})
-
-    if channel == None:
-        return Response(err['not_found'], 404)
-
-    member = await members.find_one({'id': user['_id'], 'guild_id': channel['guild_id']})
-
-    if member == None:
-        return Response(err['no_perms'], 403)
-
-    message = await find_message(channel['_id'], message_id)
+    message = await repos.messages.get(channel['_id'], message_id)
 
     if message == None:
-        return Response(err['not_found'], 404)
-
-    if member['roles'] == []:
-        guild = await guilds.find_one({'_id': channel['guild_id']})
-        v = guild['default_permission']
-    else:
-        v = member['roles'][0]['permissions']
-
-    p = Permissions(v)
-    bypassed = False
-
-    for bypass in channel['bypass']:
-        if user['_id'] == bypass['_id']:
-            _p = Permissions(bypass['value'])
-            if _p.manage_messages:
-                bypassed = True
-
-    if not p.manage_messages and not bypassed and not member['owner']:
-        return Response(err['no_perms'], 403)
+        return respond(err['not_found'], 404)
 
     # TODO: Audit Log?
-    await remove_message(channel['_id'], message['_id'])
+    await repos.messages.delete(channel['_id'], message['_id'])
     await guild_dispatch(channel['guild_id'], 'MESSAGE_DELETE', message)
 
-    return Response(json.dumps(message))
+    return respond(message)
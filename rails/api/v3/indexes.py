@@ -0,0 +1,161 @@
+# every index the queries rely on, in one place. at startup the manifest is
+# diffed against what each collection already has and only the missing ones
+# are built, all collections at once. `python -m rails.api.v3.indexes check`
+# lists missing indexes, ones the manifest doesn't know about and ones that
+# haven't been used since the server started.
+import argparse
+import asyncio
+import dataclasses
+import logging
+from typing import Dict, List, Optional, Tuple
+import pymongo
+from pymongo import IndexModel
+from ..instrumentation import register_manifest
+from .database import (
+    bind, members, guild_invites, guilds, channels, users, sessions, friends,
+    user_agent_tracking, normal_dm, group_dm, message_storage, message_tombstones, _buckets,
+)
+
+_log = logging.getLogger(__name__)
+_asc = pymongo.ASCENDING
+
+
+@dataclasses.dataclass(frozen=True)
+class Index:
+    keys: Tuple[Tuple[str, int], ...]
+    unique: bool = False
+    # seconds after the indexed date the document is removed, 0 for at that date.
+    ttl: Optional[int] = None
+    partial: Optional[dict] = None
+
+    @property
+    def name(self) -> str:
+        # the name mongo gives an index by default.
+        return '_'.join(f'{k}_{d}' for k, d in self.keys)
+
+    def model(self) -> IndexModel:
+        options = {'name': self.name}
+
+        if self.unique:
+            options['unique'] = True
+        if self.ttl is not None:
+            options['expireAfterSeconds'] = self.ttl
+        if self.partial is not None:
+            options['partialFilterExpression'] = self.partial
+
+        return IndexModel(list(self.keys), **options)
+
+def index(*fields: str, **options) -> Index:
+    return Index(tuple((f, _asc) for f in fields), **options)
+
+
+manifest = [
+    # guilds
+    (members, [index('guild_id', 'id')]),
+    (guild_invites, [index('code', unique=True), index('guild_id')]),
+    (channels, [index('guild_id')]),
+    # nothing queries it by anything but _id, listed so `check` covers it.
+    (guilds, []),
+    # users
+    (users, [
+        index('email'),
+        # only until `migrations sessions` has emptied them.
+        index('session_ids', partial={'session_ids': {'$exists': True}}),
+    ]),
+    (sessions, [index('user_id'), index('expires_at', ttl=0)]),
+    (friends, [index('other')]),
+    (user_agent_tracking, [index('name', unique=True)]),
+    # direct messages
+    (normal_dm, [index('users')]),
+    (group_dm, [index('users')]),
+]
+
+# per-channel collections only ever need their _id index.
+if message_storage == 'bucketed':
+    manifest.extend((bucket, [index('channel_id', '_id')]) for bucket in _buckets)
+    # only needed while a migration can run, long after it has finished.
+    manifest.append((message_tombstones, [index('channel_id'), index('deleted_at', ttl=30 * 24 * 3600)]))
+
+register_manifest((col.database.name, col.name, [i.keys for i in wanted]) for col, wanted in manifest)
+
+_ready = False
+
+
+def is_ready() -> bool:
+    return _ready
+
+def _label(col) -> str:
+    return f'{col.database.name}.{col.name}'
+
+def _key(spec) -> Tuple[Tuple[str, int], ...]:
+    return tuple((k, int(d)) for k, d in spec.items())
+
+async def _existing(col) -> Dict[tuple, dict]:
+    return {_key(i['key']): i async for i in col.list_indexes()}
+
+async def _apply_one(col, wanted: List[Index]) -> List[str]:
+    existing = await _existing(col)
+    missing = [i for i in wanted if i.keys not in existing]
+
+    if missing:
+        # one command per collection, mongo builds them together.
+        await col.create_indexes([i.model() for i in missing])
+
+    return [i.name for i in missing]
+
+async def apply():
+    global _ready
+
+    results = await asyncio.gather(
+        *(_apply_one(col, wanted) for col, wanted in manifest), return_exceptions=True
+    )
+
+    for (col, _), result in zip(manifest, results):
+        if isinstance(result, Exception):
+            # e.g. a unique index over duplicated data, `check` keeps listing it.
+            _log.error('building indexes on %s failed: %r', _label(col), result)
+        elif result:
+            _log.info('built %s on %s', ', '.join(result), _label(col))
+
+    # a failed build is logged instead of keeping the api down.
+    _ready = True
+
+async def _check_one(col, wanted: List[Index]) -> dict:
+    existing = await _existing(col)
+    known = {i.keys for i in wanted} | {(('_id', 1),)}
+    stats = {s['name']: s['accesses']['ops'] async for s in col.aggregate([{'$indexStats': {}}])}
+
+    return {
+        'missing': [i.name for i in wanted if i.keys not in existing],
+        'unknown': [i['name'] for k, i in existing.items() if k not in known],
+        'unused': [name for name, ops in stats.items() if ops == 0 and name != '_id_'],
+    }
+
+async def check() -> Dict[str, dict]:
+    results = await asyncio.gather(*(_check_one(col, wanted) for col, wanted in manifest))
+    return {_label(col): r for (col, _), r in zip(manifest, results)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('command', choices=('apply', 'check'))
+    args = parser.parse_args()
+
+    async def main():
+        bind()
+
+        if args.command == 'apply':
+            await apply()
+            return 0
+
+        clean = True
+
+        for label, report in (await check()).items():
+            for kind, names in report.items():
+                if names:
+                    clean = clean and kind != 'missing'
+                    print(f'{label}: {kind} {", ".join(names)}')
+
+        return 0 if clean else 1
+
+    raise SystemExit(asyncio.run(main()))
@@ -0,0 +1,106 @@
+# one-off data migrations, run with `python -m rails.api.v3.migrations <name>`.
+import argparse
+import asyncio
+import datetime
+from pymongo import ReplaceOne, UpdateOne
+from .database import bind, users, members, sessions, message_tombstones, _messages, _message_collection, message_storage
+from .sessions import _session_doc
+
+
+async def migrate_sessions(batch_size: int = 500):
+    # move users.core session_ids arrays into the sessions collection.
+    now = datetime.datetime.now(datetime.timezone.utc)
+    ops = []
+    moved = 0
+
+    async for user in users.find({'session_ids': {'$exists': True}}, {'session_ids': 1, 'bot': 1}):
+        for token in user['session_ids']:
+            doc = _session_doc(token, user['_id'], user.get('bot', False), now)
+            ops.append(ReplaceOne({'_id': doc['_id']}, doc, upsert=True))
+
+        if len(ops) >= batch_size:
+            await sessions.bulk_write(ops, ordered=False)
+            moved += len(ops)
+            ops = []
+
+    if ops:
+        await sessions.bulk_write(ops, ordered=False)
+        moved += len(ops)
+
+    await users.update_many({'session_ids': {'$exists': True}}, {'$unset': {'session_ids': ''}})
+    # members embed a copy of the user document.
+    await members.update_many({'user.session_ids': {'$exists': True}}, {'$unset': {'user.session_ids': ''}})
+
+    print(f'Moved {moved} sessions')
+
+
+async def migrate_messages(batch_size: int = 1000, drop: bool = False):
+    # copy per-channel collections into the buckets, safe to run while serving
+    # with message_storage=bucketed and message_legacy_reads=1.
+    if message_storage != 'bucketed':
+        raise SystemExit('set message_storage=bucketed before migrating messages')
+
+    copied = 0
+
+    async def write(target, name: str, ops: list, ids: list):
+        await target.bulk_write(ops, ordered=False)
+        # a message deleted after it was read from the source has been written
+        # back, its tombstone is there by now.
+        deleted = [t['_id'] async for t in message_tombstones.find({'_id': {'$in': ids}}, {'_id': 1})]
+
+        if deleted:
+            await target.delete_many({'channel_id': name, '_id': {'$in': deleted}})
+
+        return len(ops) - len(deleted)
+
+    for name in await _messages.list_collection_names():
+        if not name.isdigit():
+            continue
+
+        source = _messages.get_collection(name)
+        target = _message_collection(name)
+        deleted = {t['_id'] async for t in message_tombstones.find({'channel_id': name}, {'_id': 1})}
+        ops, ids = [], []
+
+        async for message in source.find({}).sort('_id', 1):
+            if message['_id'] in deleted:
+                continue
+
+            message['channel_id'] = name
+            _id = message.pop('_id')
+            # never clobber a copy that has been edited in the bucket since.
+            ops.append(UpdateOne({'_id': _id}, {'$setOnInsert': message}, upsert=True))
+            ids.append(_id)
+
+            if len(ops) >= batch_size:
+                copied += await write(target, name, ops, ids)
+                ops, ids = [], []
+
+        if ops:
+            copied += await write(target, name, ops, ids)
+
+        if drop:
+            await _messages.drop_collection(name)
+
+        print(f'Copied channel {name}')
+
+    print(f'Copied {copied} messages')
+
+
+migrations = {
+    'sessions': migrate_sessions,
+    'messages': migrate_messages,
+}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('name', choices=migrations.keys())
+    parser.add_argument('--drop', action='store_true', help='drop per-channel message collections once copied')
+    args = parser.parse_args()
+
+    kwargs = {'drop': args.drop} if args.name == 'messages' else {}
+    async def main():
+        bind()
+        await migrations[args.name](**kwargs)
+
+    asyncio.run(main())
@@ -1,45 +1,121 @@
+import os
+import enum
 import functools
+from typing import Dict
+from .cache import TTLCache
 
 def _has_flag(value: int, flag: int):
     return True if value & flag else False
 
+class Permission(enum.IntFlag):
+    view_channels = 1 << 0
+    manage_channels = 1 << 1
+    manage_roles = 1 << 2
+    manage_emojis = 1 << 3
+    view_audit_log = 1 << 4
+    manage_webhooks = 1 << 5
+    manage_guild = 1 << 6
+    create_invites = 1 << 7
+    change_nickname = 1 << 8
+    manage_nicknames = 1 << 9
+    kick_members = 1 << 10
+    ban_members = 1 << 11
+    send_messages = 1 << 12
+    embed_links = 1 << 13
+    attach_files = 1 << 14
+    add_reactions = 1 << 15
+    use_external_emojis = 1 << 16
+    mention_everyone = 1 << 17
+    mention_roles = 1 << 18
+    manage_messages = 1 << 19
+    read_message_history = 1 << 20
+
+    # voice channels
+    connect = 1 << 21
+    speak = 1 << 22
+    video = 1 << 23
+    use_voice_activity = 1 << 24
+    priority_speaker = 1 << 25
+    mute_members = 1 << 26
+    deafen_members = 1 << 27
+    move_members = 1 << 28
+
+    # all perms
+    admin = 1 << 29
+
+ALL = (1 << 30) - 1
+
+def has(value: int, flag: Permission) -> bool:
+    # plain int math, IntFlag operators build a new enum member every time.
+    return value & flag._value_ == flag._value_
+
 class Permissions:
+    # named access to a resolved value, for the few callers that want it.
+    __slots__ = ('value',)
+
     def __init__(self, value: int):
-        _flag_checker = functools.partial(_has_flag, value)
-        self.view_channels = _flag_checker(1 << 0)
-        self.manage_channels = _flag_checker(1 << 1)
-        self.manage_roles = _flag_checker(1 << 2)
-        self.manage_emojis = _flag_checker(1 << 3)
-        self.view_audit_log = _flag_checker(1 << 4)
-        self.manage_webhooks = _flag_checker(1 << 5)
-        self.manage_guild = _flag_checker(1 << 6)
-        self.create_invites = _flag_checker(1 << 7)
-        self.change_nickname = _flag_checker(1 << 8)
-        self.manage_nicknames = _flag_checker(1 << 9)
-        self.kick_members = _flag_checker(1 << 10)
-        self.ban_members = _flag_checker(1 << 11)
-        self.send_messages = _flag_checker(1 << 12)
-        self.embed_links = _flag_checker(1 << 13)
-        self.attach_files = _flag_checker(1 << 14)
-        self.add_reactions = _flag_checker(1 << 15)
-        self.use_external_emojis = _flag_checker(1 << 16)
-        self.mention_everyone = _flag_checker(1 << 17)
-        self.mention_roles = _flag_checker(1 << 18)
-        self.manage_messages = _flag_checker(1 << 19)
-        self.read_message_history = _flag_checker(1 << 20)
-
-        # voice channels
-        self.connect = _flag_checker(1 << 21)
-        self.speak = _flag_checker(1 << 22)
-        self.video = _flag_checker(1 << 23)
-        self.use_voice_activity = _flag_checker(1 << 24)
-        self.priority_speaker = _flag_checker(1 << 25)
-        self.mute_members = _flag_checker(1 << 26)
-        self.deafen_members = _flag_checker(1 << 27)
-        self.move_members = _flag_checker(1 << 28)
-
-        # all perms
-        self.admin = _flag_checker(1 << 29)
+        self.value = int(value)
+
+for _flag in Permission:
+    setattr(Permissions, _flag.name, property(functools.partial(lambda f, self: self.value & f != 0, _flag._value_)))
+
+
+# resolved values per (guild, member, channel). every cache key carries the
+# guild's generation, so `invalidate` drops all of a guild's values at once.
+# generations are per process, a worker that didn't make a change keeps
+# serving the old permissions until the ttl runs out, so that is how stale
+# a permission can be with more than one worker.
+_resolved = TTLCache(int(os.getenv('permission_cache_size', 50000)), float(os.getenv('permission_cache_ttl', 30)))
+_overwrites = TTLCache(int(os.getenv('permission_cache_size', 50000)), float(os.getenv('permission_cache_ttl', 30)))
+_generations: Dict[str, int] = {}
+
+def invalidate(guild_id: str):
+    _generations[guild_id] = _generations.get(guild_id, 0) + 1
+
+def _channel_overwrites(channel: dict, generation: int) -> Dict[str, int]:
+    key = (channel['_id'], generation)
+    compiled = _overwrites.get(key)
+
+    if compiled is None:
+        compiled = {b['_id']: b['value'] for b in channel.get('bypass', [])}
+        _overwrites.set(key, compiled)
+
+    return compiled
+
+def compute(guild: dict, member: dict, channel: dict = None, generation: int = 0) -> int:
+    if member.get('owner') or guild.get('owner') == member['id']:
+        return ALL
+
+    value = guild['default_permission']
+    roles = member.get('roles', [])
+
+    for role in roles:
+        value |= role['permissions']
+
+    if value & Permission.admin._value_:
+        return ALL
+
+    if channel and channel.get('bypass'):
+        overwrites = _channel_overwrites(channel, generation)
+
+        # role bypasses add on top, a bypass for the member replaces everything.
+        for role in roles:
+            value |= overwrites.get(role.get('_id'), 0)
+
+        value = overwrites.get(member['id'], value)
+
+    return value
+
+def resolve(guild: dict, member: dict, channel: dict = None) -> int:
+    generation = _generations.get(guild['_id'], 0)
+    key = (guild['_id'], member['id'], channel['_id'] if channel else None, generation)
+    value = _resolved.get(key)
+
+    if value is None:
+        value = compute(guild, member, channel, generation)
+        _resolved.set(key, value)
+
+    return value
 
 
 class UserFlags:
@@ -55,4 +131,3 @@ class GuildFlags:
         _flag_checker = functools.partial(_has_flag, value)
         self.verified = _flag_checker(1 << 0)
         self.partnered = _flag_checker(1 << 1)
-
@@ -0,0 +1,60 @@
+# named projections, applied at query time so credentials and bulk fields
+# never leave mongo. `project` applies the same specs to documents that are
+# already in memory (cached, or about to be embedded somewhere else).
+_public_user_fields = (
+    '_id', 'username', 'separator', 'bio', 'avatar_url', 'banner_url',
+    'flags', 'verified', 'system', 'bot', 'created_at',
+)
+projections = {
+    # a user as anyone else may see them.
+    'public_user': {k: 1 for k in _public_user_fields},
+    # the authenticated user, everything but credentials.
+    'session_user': {'password': 0, 'email': 0, 'session_ids': 0},
+    # a member as listed, members embed a (possibly old and full) user copy.
+    'member_summary': {
+        '_id': 0, 'id': 1, 'nick': 1, 'avatar_url': 1, 'banner_url': 1, 'joined_at': 1,
+        'deaf': 1, 'mute': 1, 'owner': 1, 'roles': 1,
+        **{f'user.{k}': 1 for k in _public_user_fields},
+    },
+    # what gets copied into every message.
+    'message_author': {
+        'id': 1, 'nick': 1, 'avatar_url': 1, 'roles': 1,
+        'user._id': 1, 'user.username': 1, 'user.separator': 1,
+        'user.avatar_url': 1, 'user.flags': 1, 'user.bot': 1, 'user.system': 1,
+    },
+    'guild_preview': {
+        '_id': 1, 'name': 1, 'description': 1, 'banner': 1, 'invite_banner': 1,
+        'vanity_url': 1, 'verified': 1, 'partnered': 1, 'official': 1, 'emojis': 1,
+    },
+    'channel_preview': {
+        '_id': 1, 'name': 1, 'description': 1, 'type': 1, 'inside_of': 1,
+        'position': 1, 'banner_url': 1,
+    },
+}
+# the member cache feeds permission checks and message authors, nothing else.
+projections['member'] = {
+    'guild_id': 1, 'owner': 1, **projections['member_summary'], **projections['message_author'],
+}
+
+def project(doc: dict, name: str) -> dict:
+    # dotted keys reach one level down.
+    spec = projections[name]
+
+    if not any(spec.values()):
+        return {k: v for k, v in doc.items() if k not in spec}
+
+    ret = {}
+
+    for key, include in spec.items():
+        if not include:
+            continue
+
+        if '.' in key:
+            outer, inner = key.split('.', 1)
+
+            if inner in doc.get(outer, {}):
+                ret.setdefault(outer, {})[inner] = doc[outer][inner]
+        elif key in doc:
+            ret[key] = doc[key]
+
+    return ret
@@ -1,37 +1,122 @@
-import asyncio
-import flask_limiter
-import quart.flask_patch
-import ulid
-from typing import Dict
-from quart import request, abort
-from dotenv import load_dotenv
-
-load_dotenv()
-
-keys: Dict[str, str] = {}
-
-def get_key_func():
-    try:
-        compat = request.method + ':' + request.endpoint + ':' + request.remote_addr
-    except:
-        abort(404)
-    for k, v in keys.items():
-        if k == compat:
-            return v
-
-    id = ulid.new().hex
-    keys[compat] = id
-    return id
-
-async def _reset():
-    await asyncio.sleep(4000)
-    keys.clear()
-    await _reset()
-
-rater = flask_limiter.Limiter(
-    default_limits=['5/second', '50/minute', '10000/hour'],
-    headers_enabled=False,
-    key_func=get_key_func,
-    retry_after='delta-seconds',
-    key_prefix=ulid.new().hex,
+# GCRA rate limiting, checking a request is one bucket lookup and a few float
+# comparisons no matter how many clients are being tracked. see rate_storage
+# for where the buckets are kept.
+import hashlib
+import os
+import time
+from typing import Dict, Optional, Tuple
+from quart import current_app, g, request
+from ..encoding import dumps
+from .checks import check_session_
+from .errors import Error, Unauthorized
+from .rate_storage import Result, Storage, from_env, parse_limits
+
+
+class RateLimited(Error):
+    status_code = 429
+
+    def __init__(self, retry_after: float):
+        super().__init__('Too Many Requests')
+        self.retry_after = retry_after
+
+    def _to_json(self):
+        return dumps({'message': '429: Too Many Requests', 'retry_after': round(self.retry_after, 3), 'code': 0})
+
+
+class Limiter:
+    def __init__(self, defaults: str, bot_defaults: str, storage: Storage, enabled: bool = True):
+        self.enabled = enabled
+        self.defaults = parse_limits(defaults)
+        self.bot_defaults = parse_limits(bot_defaults)
+        self.storage = storage
+        self._names: Dict[str, str] = {}
+
+    def limit(self, value: str, bot: str = None):
+        # stacked under the route decorator, the view is registered as is.
+        def decorator(func):
+            func._rate_limits = parse_limits(value)
+            func._bot_rate_limits = parse_limits(bot) if bot else None
+            return func
+
+        return decorator
+
+    def _bucket_name(self, endpoint: str) -> str:
+        name = self._names.get(endpoint)
+
+        if name is None:
+            name = self._names[endpoint] = hashlib.blake2b(endpoint.encode(), digest_size=8).hexdigest()
+
+        return name
+
+    async def _identity(self) -> Tuple[str, bool]:
+        # per user (or bot) when the request is authorized, per address otherwise.
+        # sessions are cached, so the route's own check is free afterwards.
+        auth = request.headers.get('Authorization')
+
+        if auth:
+            try:
+                user = await check_session_(auth)
+            except Unauthorized:
+                pass
+            else:
+                return user['_id'], user.get('bot', False)
+
+        return request.remote_addr, False
+
+    async def check(self):
+        endpoint = request.endpoint
+
+        # unmatched routes 404 before doing any work.
+        if endpoint is None or not self.enabled:
+            return
+
+        view = current_app.view_functions.get(endpoint)
+        identity, bot = await self._identity()
+
+        limits = None
+
+        if view is not None:
+            limits = getattr(view, '_bot_rate_limits' if bot else '_rate_limits', None)
+
+            if limits is None and bot:
+                limits = getattr(view, '_rate_limits', None)
+
+        if limits is None:
+            limits = self.bot_defaults if bot else self.defaults
+
+        g.rate_limit = result = self.storage.acquire((endpoint, identity), limits)
+        g.rate_limit_bucket = self._bucket_name(endpoint)
+
+        if not result.allowed:
+            raise RateLimited(result.retry_after)
+
+    def headers(self, resp):
+        result: Optional[Result] = g.get('rate_limit')
+
+        if result is None:
+            return
+
+        resp.headers['X-RateLimit-Limit'] = str(result.limit)
+        resp.headers['X-RateLimit-Remaining'] = str(result.remaining)
+        resp.headers['X-RateLimit-Reset'] = f'{time.time() + result.reset_after:.3f}'
+        resp.headers['X-RateLimit-Reset-After'] = f'{result.reset_after:.3f}'
+        resp.headers['X-RateLimit-Bucket'] = g.rate_limit_bucket
+
+        if not result.allowed:
+            resp.headers['Retry-After'] = str(int(result.retry_after) + 1)
+
+    def init_app(self, app):
+        app.before_request(self.check)
+        app.after_request(self._after)
+
+    async def _after(self, resp):
+        self.headers(resp)
+        return resp
+
+
+rater = Limiter(
+    os.getenv('ratelimit_defaults', '5/second,50/minute,10000/hour'),
+    os.getenv('ratelimit_bot_defaults', '10/second,200/minute,50000/hour'),
+    from_env(),
+    os.getenv('ratelimit_enabled', '1') == '1',
 )
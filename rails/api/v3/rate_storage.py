@@ -0,0 +1,225 @@
+# where rate limit buckets live. `memory` is per process, so with several
+# workers every one of them enforces the limits on its own. `shared` keeps
+# the buckets in a memory-mapped table that all workers on the host open, so
+# limits hold for the whole host.
+import abc
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+_periods = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+# absorbs float error, 5 * 0.2 is a hair over 1.
+_epsilon = 1e-9
+
+
+class Limit:
+    __slots__ = ('count', 'period', 'interval')
+
+    def __init__(self, count: int, period: float):
+        self.count = count
+        self.period = period
+        # one request's worth of the bucket.
+        self.interval = period / count
+
+    @classmethod
+    def parse(cls, value: str) -> 'Limit':
+        # '5/second', '30/hour'.
+        count, _, unit = value.partition('/')
+        return cls(int(count), _periods[unit.strip().rstrip('s')])
+
+def parse_limits(value: str) -> Tuple[Limit, ...]:
+    return tuple(Limit.parse(v) for v in value.replace(';', ',').split(',') if v.strip())
+
+
+class Result:
+    __slots__ = ('allowed', 'limit', 'remaining', 'reset_after', 'retry_after')
+
+    def __init__(self, allowed: bool, limit: int, remaining: int, reset_after: float, retry_after: float):
+        self.allowed = allowed
+        self.limit = limit
+        self.remaining = remaining
+        self.reset_after = reset_after
+        self.retry_after = retry_after
+
+
+def gcra(limits: Tuple[Limit, ...], tats, now: float) -> Tuple[Result, Optional[List[float]]]:
+    # a bucket is one float per limit, the "theoretical arrival time" of the
+    # next request. returns the new times, or None when the request is denied.
+    new_tats = []
+    worst = None
+
+    for limit, tat in zip(limits, tats):
+        tat = max(tat, now)
+        new_tat = tat + limit.interval
+        # how far into the future this request would push the bucket.
+        used = new_tat - now
+
+        if used > limit.period + _epsilon:
+            return Result(False, limit.count, 0, tat - now, used - limit.period), None
+
+        remaining = int((limit.period - used) / limit.interval + _epsilon)
+
+        if worst is None or remaining < worst[1]:
+            worst = (limit.count, remaining, used)
+
+        new_tats.append(new_tat)
+
+    # only spend the request once every limit has allowed it.
+    return Result(True, worst[0], worst[1], worst[2], 0), new_tats
+
+
+class Storage(abc.ABC):
+    @abc.abstractmethod
+    def acquire(self, key: tuple, limits: Tuple[Limit, ...], now: float = None) -> Result:
+        ...
+
+    @abc.abstractmethod
+    def __len__(self):
+        ...
+
+
+class MemoryStorage(Storage):
+    # an expired bucket behaves exactly like a missing one, so expiry is lazy:
+    # every call drops at most `sweep` stale buckets from the cold end.
+    def __init__(self, sweep: int = 2):
+        self.sweep = sweep
+        self._data: 'OrderedDict[tuple, Tuple[float, List[float]]]' = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def _expire(self, now: float):
+        data = self._data
+
+        for _ in range(self.sweep):
+            if not data:
+                return
+
+            key, (expires, _) = next(iter(data.items()))
+
+            if expires > now:
+                return
+
+            del data[key]
+
+    def acquire(self, key: tuple, limits: Tuple[Limit, ...], now: float = None) -> Result:
+        now = time.monotonic() if now is None else now
+        self._expire(now)
+
+        item = self._data.get(key)
+        result, new_tats = gcra(limits, item[1] if item is not None else [now] * len(limits), now)
+
+        if new_tats is not None:
+            self._data[key] = (max(new_tats), new_tats)
+            self._data.move_to_end(key)
+
+        return result
+
+
+class SharedMemoryStorage(Storage):
+    # an open addressed table in a file (under /dev/shm by default), mapped by
+    # every worker. keys hash to a group of `group_size` slots, and a group is
+    # only read or written under an fcntl lock on its own byte range, so
+    # workers only wait on each other when they hit the same group.
+    #
+    # a slot is the key's digest, the time the bucket is full again (0 when
+    # the slot is free) and up to `max_limits` arrival times. wall clock time
+    # is used, it means the same thing in every process and after a restart.
+    # when every slot of a group is live the one closest to expiring is given
+    # up, that only ever makes a limit more lenient, size the table so it
+    # doesn't happen.
+    max_limits = 4
+    group_size = 8
+    _slot = struct.Struct(f'16sd{max_limits}d')
+    _slot_size = 64
+
+    def __init__(self, path: str, slots: int):
+        self.path = path
+        self.groups = max(1, slots // self.group_size)
+        self._group_bytes = self.group_size * self._slot_size
+        size = self.groups * self._group_bytes
+
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+
+        # every worker runs this, truncating only ever grows the file.
+        if os.fstat(self._fd).st_size < size:
+            os.ftruncate(self._fd, size)
+
+        self._map = mmap.mmap(self._fd, size)
+
+    def __len__(self):
+        now = time.time()
+        live = 0
+
+        for offset in range(0, self.groups * self._group_bytes, self._slot_size):
+            if self._slot.unpack_from(self._map, offset)[1] > now:
+                live += 1
+
+        return live
+
+    def _digest(self, key: tuple) -> bytes:
+        return hashlib.blake2b('\0'.join(key).encode(), digest_size=16).digest()
+
+    def acquire(self, key: tuple, limits: Tuple[Limit, ...], now: float = None) -> Result:
+        if len(limits) > self.max_limits:
+            raise ValueError(f'at most {self.max_limits} limits per bucket')
+
+        digest = self._digest(key)
+        group = int.from_bytes(digest[:8], 'little') % self.groups
+        start = group * self._group_bytes
+
+        fcntl.lockf(self._fd, fcntl.LOCK_EX, self._group_bytes, start)
+
+        try:
+            # read the clock under the lock, so arrival times only move forward.
+            now = time.time() if now is None else now
+            found = free = None
+            oldest = (float('inf'), start)
+
+            for offset in range(start, start + self._group_bytes, self._slot_size):
+                slot = self._slot.unpack_from(self._map, offset)
+
+                if slot[0] == digest:
+                    found = (offset, slot)
+                    break
+
+                if slot[1] <= now:
+                    free = offset if free is None else free
+                elif slot[1] < oldest[0]:
+                    oldest = (slot[1], offset)
+
+            if found is not None and found[1][1] > now:
+                offset, tats = found[0], found[1][2:2 + len(limits)]
+            else:
+                offset = found[0] if found is not None else (free if free is not None else oldest[1])
+                tats = [now] * len(limits)
+
+            result, new_tats = gcra(limits, tats, now)
+
+            if new_tats is not None:
+                padded = new_tats + [0.0] * (self.max_limits - len(new_tats))
+                self._slot.pack_into(self._map, offset, digest, max(new_tats), *padded)
+
+            return result
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, self._group_bytes, start)
+
+
+def from_env() -> Storage:
+    kind = os.getenv('ratelimit_storage', 'memory')
+
+    if kind == 'memory':
+        return MemoryStorage()
+
+    if kind == 'shared':
+        return SharedMemoryStorage(
+            os.getenv('ratelimit_shared_path', '/dev/shm/rails-ratelimit'),
+            int(os.getenv('ratelimit_shared_slots', 1 << 18)),
+        )
+
+    raise ValueError(f'unknown ratelimit_storage {kind!r}')
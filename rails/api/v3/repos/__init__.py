@@ -0,0 +1,35 @@
+# storage for every route, picked once per process by `storage_backend`:
+# 'mongo' (the default) or 'memory' for tests, benchmarks and the load harness.
+# routes only ever go through the instances below, so caching, batching and
+# query shapes can change here without touching them.
+import os
+import dotenv
+from .base import UsersRepo, GuildsRepo, ChannelsRepo, MembersRepo, MessagesRepo, InvitesRepo, SessionsRepo
+
+dotenv.load_dotenv()
+
+backend = os.getenv('storage_backend', 'mongo')
+
+if backend == 'mongo':
+    from . import mongo
+
+    users: UsersRepo = mongo.MongoUsers()
+    guilds: GuildsRepo = mongo.MongoGuilds()
+    channels: ChannelsRepo = mongo.MongoChannels()
+    members: MembersRepo = mongo.MongoMembers()
+    messages: MessagesRepo = mongo.MongoMessages()
+    invites: InvitesRepo = mongo.MongoInvites()
+    sessions: SessionsRepo = mongo.MongoSessions()
+elif backend == 'memory':
+    from . import memory
+
+    store = memory.Store()
+    users: UsersRepo = memory.MemoryUsers(store)
+    guilds: GuildsRepo = memory.MemoryGuilds(store)
+    channels: ChannelsRepo = memory.MemoryChannels(store)
+    members: MembersRepo = memory.MemoryMembers(store)
+    messages: MessagesRepo = memory.MemoryMessages(store)
+    invites: InvitesRepo = memory.MemoryInvites(store)
+    sessions: SessionsRepo = memory.MemorySessions(store)
+else:
+    raise ValueError(f'unknown storage_backend {backend!r}')
@@ -0,0 +1,240 @@
+# what routes may ask of storage. ids are snowflake strings, documents are
+# plain dicts the caller owns (changing one never changes what is stored), and
+# `projection` arguments name an entry of projections.projections.
+import abc
+from typing import AsyncIterator, Iterable, List, Optional
+
+
+class UsersRepo(abc.ABC):
+    @abc.abstractmethod
+    async def get(self, user_id: str, projection: Optional[str] = 'public_user') -> Optional[dict]:
+        ...
+
+    @abc.abstractmethod
+    async def exists(self, user_id: str) -> bool:
+        ...
+
+    @abc.abstractmethod
+    async def email_taken(self, email_hash: str) -> bool:
+        ...
+
+    @abc.abstractmethod
+    async def find_login(self, email_hash: str) -> Optional[dict]:
+        # _id, password and bot of the account behind an email.
+        ...
+
+    @abc.abstractmethod
+    async def create(self, user: dict, settings: dict):
+        ...
+
+    @abc.abstractmethod
+    async def create_many(self, users: List[dict]):
+        # bulk loads, no settings.
+        ...
+
+    @abc.abstractmethod
+    async def update(self, user_id: str, fields: dict):
+        ...
+
+    @abc.abstractmethod
+    async def delete(self, user_id: str):
+        ...
+
+    @abc.abstractmethod
+    async def replace_password(self, user_id: str, old: str, new: str) -> bool:
+        # only if the stored hash is still `old`.
+        ...
+
+    @abc.abstractmethod
+    async def block(self, user_id: str, other_id: str):
+        ...
+
+    @abc.abstractmethod
+    async def unblock(self, user_id: str, other_id: str):
+        ...
+
+    @abc.abstractmethod
+    async def not_blocking(self, user_ids: List[str], other_id: str) -> List[str]:
+        # `user_ids` minus anyone who blocked `other_id`, order kept.
+        ...
+
+    @abc.abstractmethod
+    async def settings(self, user_id: str) -> Optional[dict]:
+        ...
+
+    @abc.abstractmethod
+    async def update_settings(self, user_id: str, fields: dict):
+        ...
+
+    @abc.abstractmethod
+    async def friends(self, user_id: str) -> List[str]:
+        ...
+
+    @abc.abstractmethod
+    async def add_friend(self, user_id: str, other_id: str):
+        # as a pending request.
+        ...
+
+    @abc.abstractmethod
+    async def remove_friend(self, user_id: str, other_id: str):
+        ...
+
+
+class GuildsRepo(abc.ABC):
+    @abc.abstractmethod
+    async def get(self, guild_id: str) -> Optional[dict]:
+        ...
+
+    @abc.abstractmethod
+    async def preview(self, guild_id: str) -> Optional[dict]:
+        ...
+
+    @abc.abstractmethod
+    async def create(self, guild: dict):
+        ...
+
+    @abc.abstractmethod
+    async def update(self, guild_id: str, fields: dict):
+        ...
+
+    @abc.abstractmethod
+    async def delete(self, guild_id: str):
+        # the guild only, its channels and members are deleted through their repos.
+        ...
+
+
+class ChannelsRepo(abc.ABC):
+    @abc.abstractmethod
+    async def get(self, channel_id: str) -> Optional[dict]:
+        ...
+
+    @abc.abstractmethod
+    async def previews(self, guild_id: str) -> List[dict]:
+        ...
+
+    @abc.abstractmethod
+    async def create(self, channel: dict):
+        ...
+
+    @abc.abstractmethod
+    async def create_many(self, channels: List[dict]):
+        ...
+
+    @abc.abstractmethod
+    async def update(self, channel_id: str, fields: dict):
+        ...
+
+    @abc.abstractmethod
+    async def delete(self, channel_id: str):
+        ...
+
+    @abc.abstractmethod
+    async def delete_all(self, guild_id: str):
+        ...
+
+
+class MembersRepo(abc.ABC):
+    @abc.abstractmethod
+    async def get(self, guild_id: str, user_id: str) -> Optional[dict]:
+        # projected with 'member'.
+        ...
+
+    @abc.abstractmethod
+    async def create(self, member: dict):
+        ...
+
+    @abc.abstractmethod
+    async def create_many(self, members: List[dict]):
+        ...
+
+    @abc.abstractmethod
+    async def delete_all(self, guild_id: str):
+        ...
+
+    @abc.abstractmethod
+    def page(self, guild_id: str, after: str = None, limit: int = 0) -> AsyncIterator[dict]:
+        # 'member_summary' projections in id order, 0 for no limit.
+        ...
+
+    @abc.abstractmethod
+    async def mentioned(self, guild_id: str, user_ids: Iterable[str], role_ids: Iterable[str]) -> List[str]:
+        # ids of members mentioned directly or through one of their roles.
+        ...
+
+
+class MessagesRepo(abc.ABC):
+    @abc.abstractmethod
+    async def create(self, channel_id: str, message: dict):
+        # stored with its channel_id, like every stored message.
+        ...
+
+    @abc.abstractmethod
+    async def get(self, channel_id: str, message_id: str) -> Optional[dict]:
+        ...
+
+    @abc.abstractmethod
+    async def page(
+        self, channel_id: str, before: str = None, after: str = None, around: str = None, limit: int = 50
+    ) -> List[dict]:
+        # newest first, at most one of the cursors is given.
+        ...
+
+    @abc.abstractmethod
+    async def edit(self, channel_id: str, message_id: str, fields: dict) -> bool:
+        ...
+
+    @abc.abstractmethod
+    async def delete(self, channel_id: str, message_id: str):
+        ...
+
+    @abc.abstractmethod
+    async def delete_channel(self, channel_id: str):
+        ...
+
+
+class InvitesRepo(abc.ABC):
+    @abc.abstractmethod
+    async def get(self, code: str) -> Optional[dict]:
+        ...
+
+    @abc.abstractmethod
+    async def create(self, guild_id: str, code: str):
+        ...
+
+
+class SessionsRepo(abc.ABC):
+    # documents come from sessions._session_doc, keyed by the token's hash.
+    @abc.abstractmethod
+    async def create(self, session: dict):
+        ...
+
+    @abc.abstractmethod
+    async def resolve(self, session_id: str) -> Optional[dict]:
+        # the session with its 'session_user' projected user under 'user'.
+        ...
+
+    @abc.abstractmethod
+    async def touch(self, session_id: str, fields: dict):
+        ...
+
+    @abc.abstractmethod
+    async def delete(self, session_id: str, user_id: str) -> bool:
+        ...
+
+    @abc.abstractmethod
+    async def delete_all(self, user_id: str):
+        ...
+
+    @abc.abstractmethod
+    async def count(self, user_id: str) -> int:
+        ...
+
+    @abc.abstractmethod
+    async def find_legacy(self, token: str) -> Optional[dict]:
+        # _id and bot of the user still holding `token` in session_ids.
+        ...
+
+    @abc.abstractmethod
+    async def move_legacy(self, session: dict, token: str):
+        # store `session` and take `token` off of its user.
+        ...
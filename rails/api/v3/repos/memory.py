@@ -0,0 +1,375 @@
+# dict backed repositories for tests, benchmarks and the load harness. no
+# network and no caches, documents are copied in and out so callers see the
+# same ownership rules as with mongo. ids are ordered like mongo pages them,
+# by snowflakes.id_key.
+import bisect
+import copy
+from typing import Dict, Iterable, List, Optional, Tuple
+from ..projections import project
+from ..snowflakes import id_key
+from .base import (
+    UsersRepo, GuildsRepo, ChannelsRepo, MembersRepo, MessagesRepo, InvitesRepo, SessionsRepo,
+)
+
+
+class _Sorted:
+    # documents by id, with the ids kept in order for range reads.
+    __slots__ = ('keys', 'docs')
+
+    def __init__(self):
+        self.keys: List[Tuple[int, str]] = []
+        self.docs: Dict[str, dict] = {}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, _id: str, doc: dict):
+        if _id not in self.docs:
+            bisect.insort(self.keys, id_key(_id))
+
+        self.docs[_id] = doc
+
+    def remove(self, _id: str) -> bool:
+        if self.docs.pop(_id, None) is None:
+            return False
+
+        del self.keys[bisect.bisect_left(self.keys, id_key(_id))]
+        return True
+
+    def position(self, _id: str, after: bool = False) -> int:
+        # where `_id` is or would go, past it with `after`.
+        return (bisect.bisect_right if after else bisect.bisect_left)(self.keys, id_key(_id))
+
+    def ids(self, start: int = 0, stop: int = None) -> List[str]:
+        return [k[1] for k in self.keys[start:stop]]
+
+
+class Store:
+    # everything one set of repositories shares, so e.g. sessions can see users.
+    def __init__(self):
+        self.users: Dict[str, dict] = {}
+        self.emails: Dict[str, str] = {}
+        self.settings: Dict[str, dict] = {}
+        # user id -> other user id -> still a request.
+        self.friends: Dict[str, Dict[str, bool]] = {}
+        self.guilds: Dict[str, dict] = {}
+        self.channels: Dict[str, dict] = {}
+        self.guild_channels: Dict[str, List[str]] = {}
+        self.members: Dict[str, _Sorted] = {}
+        self.messages: Dict[str, _Sorted] = {}
+        self.invites: Dict[str, dict] = {}
+        self.sessions: Dict[str, dict] = {}
+
+
+class _Repo:
+    def __init__(self, store: Store):
+        self.store = store
+
+
+class MemoryUsers(_Repo, UsersRepo):
+    async def get(self, user_id: str, projection: Optional[str] = 'public_user') -> Optional[dict]:
+        user = self.store.users.get(user_id)
+
+        if user is None:
+            return None
+
+        return copy.deepcopy(project(user, projection) if projection else user)
+
+    async def exists(self, user_id: str) -> bool:
+        return user_id in self.store.users
+
+    async def email_taken(self, email_hash: str) -> bool:
+        return email_hash in self.store.emails
+
+    async def find_login(self, email_hash: str) -> Optional[dict]:
+        user = self.store.users.get(self.store.emails.get(email_hash))
+
+        if user is None:
+            return None
+
+        return {'_id': user['_id'], 'password': user['password'], 'bot': user['bot']}
+
+    def _add(self, user: dict):
+        self.store.users[user['_id']] = copy.deepcopy(user)
+
+        if user.get('email'):
+            self.store.emails[user['email']] = user['_id']
+
+    async def create(self, user: dict, settings: dict):
+        self.store.settings[settings['_id']] = copy.deepcopy(settings)
+        self._add(user)
+
+    async def create_many(self, users: List[dict]):
+        for user in users:
+            self._add(user)
+
+    async def update(self, user_id: str, fields: dict):
+        user = self.store.users.get(user_id)
+
+        if user is None:
+            return
+
+        if 'email' in fields:
+            self.store.emails.pop(user.get('email'), None)
+            self.store.emails[fields['email']] = user_id
+
+        user.update(copy.deepcopy(fields))
+
+    async def delete(self, user_id: str):
+        user = self.store.users.pop(user_id, None)
+        self.store.settings.pop(user_id, None)
+
+        if user is not None:
+            self.store.emails.pop(user.get('email'), None)
+
+    async def replace_password(self, user_id: str, old: str, new: str) -> bool:
+        user = self.store.users.get(user_id)
+
+        if user is None or user['password'] != old:
+            return False
+
+        user['password'] = new
+        return True
+
+    async def block(self, user_id: str, other_id: str):
+        user = self.store.users.get(user_id)
+
+        if user is not None and other_id not in user.setdefault('blocked_users', []):
+            user['blocked_users'].append(other_id)
+
+    async def unblock(self, user_id: str, other_id: str):
+        user = self.store.users.get(user_id)
+
+        if user is not None and other_id in user.get('blocked_users', ()):
+            user['blocked_users'].remove(other_id)
+
+    async def not_blocking(self, user_ids: List[str], other_id: str) -> List[str]:
+        users = self.store.users
+
+        return [
+            i for i in user_ids
+            if i not in users or other_id not in users[i].get('blocked_users', ())
+        ]
+
+    async def settings(self, user_id: str) -> Optional[dict]:
+        return copy.deepcopy(self.store.settings.get(user_id))
+
+    async def update_settings(self, user_id: str, fields: dict):
+        if user_id in self.store.settings:
+            self.store.settings[user_id].update(copy.deepcopy(fields))
+
+    async def friends(self, user_id: str) -> List[str]:
+        return [other for other, request in self.store.friends.get(user_id, {}).items() if not request]
+
+    async def add_friend(self, user_id: str, other_id: str):
+        self.store.friends.setdefault(user_id, {})[other_id] = True
+
+    async def remove_friend(self, user_id: str, other_id: str):
+        self.store.friends.get(user_id, {}).pop(other_id, None)
+
+
+class MemoryGuilds(_Repo, GuildsRepo):
+    async def get(self, guild_id: str) -> Optional[dict]:
+        return copy.deepcopy(self.store.guilds.get(guild_id))
+
+    async def preview(self, guild_id: str) -> Optional[dict]:
+        guild = self.store.guilds.get(guild_id)
+        return None if guild is None else copy.deepcopy(project(guild, 'guild_preview'))
+
+    async def create(self, guild: dict):
+        self.store.guilds[guild['_id']] = copy.deepcopy(guild)
+
+    async def update(self, guild_id: str, fields: dict):
+        if guild_id in self.store.guilds:
+            self.store.guilds[guild_id].update(copy.deepcopy(fields))
+
+    async def delete(self, guild_id: str):
+        self.store.guilds.pop(guild_id, None)
+
+
+class MemoryChannels(_Repo, ChannelsRepo):
+    async def get(self, channel_id: str) -> Optional[dict]:
+        return copy.deepcopy(self.store.channels.get(channel_id))
+
+    async def previews(self, guild_id: str) -> List[dict]:
+        channels = self.store.channels
+
+        return [
+            copy.deepcopy(project(channels[i], 'channel_preview'))
+            for i in self.store.guild_channels.get(guild_id, ())
+        ]
+
+    async def create(self, channel: dict):
+        self.store.channels[channel['_id']] = copy.deepcopy(channel)
+        self.store.guild_channels.setdefault(channel['guild_id'], []).append(channel['_id'])
+
+    async def create_many(self, channels: List[dict]):
+        for channel in channels:
+            await self.create(channel)
+
+    async def update(self, channel_id: str, fields: dict):
+        if channel_id in self.store.channels:
+            self.store.channels[channel_id].update(copy.deepcopy(fields))
+
+    async def delete(self, channel_id: str):
+        channel = self.store.channels.pop(channel_id, None)
+
+        if channel is not None:
+            self.store.guild_channels[channel['guild_id']].remove(channel_id)
+
+    async def delete_all(self, guild_id: str):
+        for channel_id in self.store.guild_channels.pop(guild_id, ()):
+            self.store.channels.pop(channel_id, None)
+
+
+class MemoryMembers(_Repo, MembersRepo):
+    async def get(self, guild_id: str, user_id: str) -> Optional[dict]:
+        guild = self.store.members.get(guild_id)
+        member = guild.docs.get(user_id) if guild else None
+
+        return None if member is None else copy.deepcopy(project(member, 'member'))
+
+    async def create(self, member: dict):
+        self.store.members.setdefault(member['guild_id'], _Sorted()).add(member['id'], copy.deepcopy(member))
+
+    async def create_many(self, members: List[dict]):
+        for member in members:
+            await self.create(member)
+
+    async def delete_all(self, guild_id: str):
+        self.store.members.pop(guild_id, None)
+
+    async def page(self, guild_id: str, after: str = None, limit: int = 0):
+        guild = self.store.members.get(guild_id)
+
+        if guild is None:
+            return
+
+        start = guild.position(after, after=True) if after else 0
+        # copied up front, the guild may change while the caller awaits.
+        ids = guild.ids(start, start + limit if limit else None)
+        page = [copy.deepcopy(project(guild.docs[i], 'member_summary')) for i in ids]
+
+        for member in page:
+            yield member
+
+    async def mentioned(self, guild_id: str, user_ids: Iterable[str], role_ids: Iterable[str]) -> List[str]:
+        guild = self.store.members.get(guild_id)
+
+        if guild is None:
+            return []
+
+        user_ids, role_ids = set(user_ids or ()), set(role_ids or ())
+
+        if not user_ids and not role_ids:
+            return []
+
+        found = [i for i in user_ids if i in guild.docs]
+
+        if role_ids:
+            found.extend(
+                i for i in guild.ids()
+                if i not in user_ids and any(r.get('_id') in role_ids for r in guild.docs[i].get('roles', ()))
+            )
+
+        return found
+
+
+class MemoryMessages(_Repo, MessagesRepo):
+    def _channel(self, channel_id: str) -> _Sorted:
+        return self.store.messages.get(channel_id) or _Sorted()
+
+    def _copies(self, channel: _Sorted, ids: List[str]) -> List[dict]:
+        return [copy.deepcopy(channel.docs[i]) for i in ids]
+
+    async def create(self, channel_id: str, message: dict):
+        self.store.messages.setdefault(channel_id, _Sorted()).add(message['_id'], {**copy.deepcopy(message), 'channel_id': channel_id})
+
+    async def get(self, channel_id: str, message_id: str) -> Optional[dict]:
+        return copy.deepcopy(self._channel(channel_id).docs.get(message_id))
+
+    async def page(
+        self, channel_id: str, before: str = None, after: str = None, around: str = None, limit: int = 50
+    ) -> List[dict]:
+        channel = self._channel(channel_id)
+
+        if around:
+            i = channel.position(around)
+            older = channel.ids(max(i - limit // 2, 0), i)
+            newer = channel.ids(i, i + limit - limit // 2)
+            return self._copies(channel, (older + newer)[::-1])
+
+        if after:
+            i = channel.position(after, after=True)
+            return self._copies(channel, channel.ids(i, i + limit)[::-1])
+
+        i = channel.position(before) if before else len(channel)
+        return self._copies(channel, channel.ids(max(i - limit, 0), i)[::-1])
+
+    async def edit(self, channel_id: str, message_id: str, fields: dict) -> bool:
+        message = self._channel(channel_id).docs.get(message_id)
+
+        if message is None:
+            return False
+
+        message.update(copy.deepcopy(fields))
+        return True
+
+    async def delete(self, channel_id: str, message_id: str):
+        self._channel(channel_id).remove(message_id)
+
+    async def delete_channel(self, channel_id: str):
+        self.store.messages.pop(channel_id, None)
+
+
+class MemoryInvites(_Repo, InvitesRepo):
+    async def get(self, code: str) -> Optional[dict]:
+        return copy.deepcopy(self.store.invites.get(code))
+
+    async def create(self, guild_id: str, code: str):
+        self.store.invites[code] = {'guild_id': guild_id, 'code': code}
+
+
+class MemorySessions(_Repo, SessionsRepo):
+    async def create(self, session: dict):
+        self.store.sessions[session['_id']] = copy.deepcopy(session)
+
+    async def resolve(self, session_id: str) -> Optional[dict]:
+        session = self.store.sessions.get(session_id)
+        user = self.store.users.get(session['user_id']) if session else None
+
+        if user is None:
+            return None
+
+        return copy.deepcopy({**session, 'user': project(user, 'session_user')})
+
+    async def touch(self, session_id: str, fields: dict):
+        if session_id in self.store.sessions:
+            self.store.sessions[session_id].update(fields)
+
+    async def delete(self, session_id: str, user_id: str) -> bool:
+        session = self.store.sessions.get(session_id)
+
+        if session is None or session['user_id'] != user_id:
+            return False
+
+        del self.store.sessions[session_id]
+        return True
+
+    async def delete_all(self, user_id: str):
+        for session_id in [k for k, s in self.store.sessions.items() if s['user_id'] == user_id]:
+            del self.store.sessions[session_id]
+
+    async def count(self, user_id: str) -> int:
+        return sum(1 for s in self.store.sessions.values() if s['user_id'] == user_id)
+
+    async def find_legacy(self, token: str) -> Optional[dict]:
+        for user in self.store.users.values():
+            if token in user.get('session_ids', ()):
+                return {'_id': user['_id'], 'bot': user.get('bot', False)}
+
+        return None
+
+    async def move_legacy(self, session: dict, token: str):
+        self.store.sessions[session['_id']] = copy.deepcopy(session)
+        self.store.users[session['user_id']]['session_ids'].remove(token)
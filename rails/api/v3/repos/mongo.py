@@ -0,0 +1,227 @@
+# the motor backed repositories. reads of guilds, channels and members go
+# through the read-through caches in database.py, and every write here drops
+# the entries it makes stale so routes never have to.
+from typing import Iterable, List, Optional
+from .. import database as db
+from ..projections import projections
+from .base import (
+    UsersRepo, GuildsRepo, ChannelsRepo, MembersRepo, MessagesRepo, InvitesRepo, SessionsRepo,
+)
+
+
+class MongoUsers(UsersRepo):
+    async def get(self, user_id: str, projection: Optional[str] = 'public_user') -> Optional[dict]:
+        return await db.users.find_one({'_id': user_id}, projections[projection] if projection else None)
+
+    async def exists(self, user_id: str) -> bool:
+        return await db.users.find_one({'_id': user_id}, {'_id': 1}) != None
+
+    async def email_taken(self, email_hash: str) -> bool:
+        return await db.users.find_one({'email': email_hash}, {'_id': 1}) != None
+
+    async def find_login(self, email_hash: str) -> Optional[dict]:
+        return await db.users.find_one({'email': email_hash}, {'password': 1, 'bot': 1})
+
+    async def create(self, user: dict, settings: dict):
+        await db.user_settings.insert_one(dict(settings))
+        await db.users.insert_one(dict(user))
+
+    async def create_many(self, users: List[dict]):
+        await db.users.insert_many([dict(u) for u in users], ordered=False)
+
+    async def update(self, user_id: str, fields: dict):
+        await db.users.update_one({'_id': user_id}, {'$set': fields})
+
+    async def delete(self, user_id: str):
+        await db.users.delete_one({'_id': user_id})
+        await db.user_settings.delete_one({'_id': user_id})
+
+    async def replace_password(self, user_id: str, old: str, new: str) -> bool:
+        r = await db.users.update_one({'_id': user_id, 'password': old}, {'$set': {'password': new}})
+        return r.modified_count == 1
+
+    async def block(self, user_id: str, other_id: str):
+        await db.users.update_one({'_id': user_id}, {'$addToSet': {'blocked_users': other_id}})
+
+    async def unblock(self, user_id: str, other_id: str):
+        await db.users.update_one({'_id': user_id}, {'$pull': {'blocked_users': other_id}})
+
+    async def not_blocking(self, user_ids: List[str], other_id: str) -> List[str]:
+        if user_ids == []:
+            return []
+
+        blocked = db.users.find({'_id': {'$in': user_ids}, 'blocked_users': other_id}, {'_id': 1})
+        blocked_ids = {u['_id'] async for u in blocked}
+
+        return [i for i in user_ids if i not in blocked_ids]
+
+    async def settings(self, user_id: str) -> Optional[dict]:
+        return await db.user_settings.find_one({'_id': user_id})
+
+    async def update_settings(self, user_id: str, fields: dict):
+        await db.user_settings.update_one({'_id': user_id}, {'$set': fields})
+
+    async def friends(self, user_id: str) -> List[str]:
+        return [f['other'] async for f in db.friends.find({'_id': user_id, 'request': False}, {'other': 1})]
+
+    async def add_friend(self, user_id: str, other_id: str):
+        await db.friends.insert_one({'_id': user_id, 'other': other_id, 'request': True})
+
+    async def remove_friend(self, user_id: str, other_id: str):
+        await db.friends.delete_one({'_id': user_id, 'other': other_id})
+
+
+class MongoGuilds(GuildsRepo):
+    async def get(self, guild_id: str) -> Optional[dict]:
+        return await db.get_guild(guild_id)
+
+    async def preview(self, guild_id: str) -> Optional[dict]:
+        return await db.guilds.find_one({'_id': guild_id}, projections['guild_preview'])
+
+    async def create(self, guild: dict):
+        # insert_one sets _id on the dict it's given, it's ours to keep.
+        await db.guilds.insert_one(dict(guild))
+
+    async def update(self, guild_id: str, fields: dict):
+        await db.guilds.update_one({'_id': guild_id}, {'$set': fields})
+        db.invalidate_guild(guild_id)
+
+    async def delete(self, guild_id: str):
+        await db.guilds.delete_one({'_id': guild_id})
+        db.invalidate_guild(guild_id)
+
+
+class MongoChannels(ChannelsRepo):
+    async def get(self, channel_id: str) -> Optional[dict]:
+        return await db.get_channel(channel_id)
+
+    async def previews(self, guild_id: str) -> List[dict]:
+        return await db.channels.find({'guild_id': guild_id}, projections['channel_preview']).to_list(None)
+
+    async def create(self, channel: dict):
+        await db.channels.insert_one(dict(channel))
+        db.invalidate_channel(channel['_id'])
+
+    async def create_many(self, channels: List[dict]):
+        await db.channels.insert_many([dict(c) for c in channels])
+
+        for c in channels:
+            db.invalidate_channel(c['_id'])
+
+    async def update(self, channel_id: str, fields: dict):
+        await db.channels.update_one({'_id': channel_id}, {'$set': fields})
+        db.invalidate_channel(channel_id)
+
+    async def delete(self, channel_id: str):
+        await db.channels.delete_one({'_id': channel_id})
+        db.invalidate_channel(channel_id)
+
+    async def delete_all(self, guild_id: str):
+        await db.channels.delete_many({'guild_id': guild_id})
+        db.forget_guild_channels(guild_id)
+
+
+class MongoMembers(MembersRepo):
+    async def get(self, guild_id: str, user_id: str) -> Optional[dict]:
+        return await db.get_member(guild_id, user_id)
+
+    async def create(self, member: dict):
+        await db.members.insert_one(dict(member))
+        db.invalidate_member(member['guild_id'], member['id'])
+
+    async def create_many(self, members: List[dict]):
+        await db.members.insert_many([dict(m) for m in members], ordered=False)
+
+        for m in members:
+            db.invalidate_member(m['guild_id'], m['id'])
+
+    async def delete_all(self, guild_id: str):
+        await db.members.delete_many({'guild_id': guild_id})
+        db.forget_guild_members(guild_id)
+
+    def page(self, guild_id: str, after: str = None, limit: int = 0):
+        return db.guild_members(guild_id, after, limit)
+
+    async def mentioned(self, guild_id: str, user_ids: Iterable[str], role_ids: Iterable[str]) -> List[str]:
+        match = []
+
+        if user_ids:
+            match.append({'id': {'$in': list(user_ids)}})
+
+        if role_ids:
+            match.append({'roles._id': {'$in': list(role_ids)}})
+
+        if match == []:
+            return []
+
+        found = db.members.find({'guild_id': guild_id, '$or': match}, {'id': 1, '_id': 0})
+
+        return [m['id'] async for m in found]
+
+
+class MongoMessages(MessagesRepo):
+    async def create(self, channel_id: str, message: dict):
+        await db.send_message(channel_id, dict(message))
+
+    async def get(self, channel_id: str, message_id: str) -> Optional[dict]:
+        return await db.get_message(channel_id, message_id)
+
+    async def page(
+        self, channel_id: str, before: str = None, after: str = None, around: str = None, limit: int = 50
+    ) -> List[dict]:
+        return await db.get_messages(channel_id, before, after, around, limit)
+
+    async def edit(self, channel_id: str, message_id: str, fields: dict) -> bool:
+        r = await db.edit_message(channel_id, message_id, {'$set': fields})
+        return r.matched_count == 1
+
+    async def delete(self, channel_id: str, message_id: str):
+        await db.delete_message(channel_id, message_id)
+
+    async def delete_channel(self, channel_id: str):
+        await db.delete_channel_messages(channel_id)
+
+
+class MongoInvites(InvitesRepo):
+    async def get(self, code: str) -> Optional[dict]:
+        return await db.guild_invites.find_one({'code': code})
+
+    async def create(self, guild_id: str, code: str):
+        await db.guild_invites.insert_one({'guild_id': guild_id, 'code': code})
+
+
+class MongoSessions(SessionsRepo):
+    async def create(self, session: dict):
+        await db.sessions.insert_one(dict(session))
+
+    async def resolve(self, session_id: str) -> Optional[dict]:
+        # session and user in one round trip, both collections live in `users`.
+        pipeline = [
+            {'$match': {'_id': session_id}},
+            {'$lookup': {'from': 'core', 'localField': 'user_id', 'foreignField': '_id', 'as': 'user'}},
+            {'$unwind': '$user'},
+            {'$project': {f'user.{k}': 0 for k in projections['session_user']}},
+        ]
+        found = await db.sessions.aggregate(pipeline).to_list(1)
+
+        return found[0] if found else None
+
+    async def touch(self, session_id: str, fields: dict):
+        await db.sessions.update_one({'_id': session_id}, {'$set': fields})
+
+    async def delete(self, session_id: str, user_id: str) -> bool:
+        r = await db.sessions.delete_one({'_id': session_id, 'user_id': user_id})
+        return r.deleted_count == 1
+
+    async def delete_all(self, user_id: str):
+        await db.sessions.delete_many({'user_id': user_id})
+
+    async def count(self, user_id: str) -> int:
+        return await db.sessions.count_documents({'user_id': user_id})
+
+    async def find_legacy(self, token: str) -> Optional[dict]:
+        return await db.users.find_one({'session_ids': token}, {'bot': 1})
+
+    async def move_legacy(self, session: dict, token: str):
+        await db.sessions.replace_one({'_id': session['_id']}, session, upsert=True)
+        await db.users.update_one({'_id': session['user_id']}, {'$pull': {'session_ids': token}})
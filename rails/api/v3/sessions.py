@@ -0,0 +1,83 @@
+# session storage, tokens are only ever stored hashed.
+import asyncio
+import datetime
+import hashlib
+import os
+from . import repos
+from .snowflakes import hash_from
+
+session_ttl = datetime.timedelta(days=int(os.getenv('session_ttl_days', 30)))
+# last_seen (and with it the expiry) is only bumped this often per session.
+touch_interval = datetime.timedelta(seconds=int(os.getenv('session_touch_interval', 300)))
+# look tokens up in the old session_ids arrays until `migrations sessions` has run.
+legacy_fallback = os.getenv('session_legacy_fallback', '1') == '1'
+
+
+def hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def _session_doc(token: str, user_id: str, bot: bool, now: datetime.datetime):
+    return {
+        '_id': hash_token(token),
+        'user_id': user_id,
+        'bot': bot,
+        'created_at': now,
+        'last_seen': now,
+        # bot tokens never expire, the ttl index ignores documents without a date.
+        'expires_at': None if bot else now + session_ttl,
+    }
+
+async def create_session(user_id: str, bot: bool = False, token: str = None) -> str:
+    token = token or hash_from()
+
+    await repos.sessions.create(
+        _session_doc(token, user_id, bot, datetime.datetime.now(datetime.timezone.utc))
+    )
+
+    return token
+
+async def revoke_session(token: str, user_id: str) -> bool:
+    return await repos.sessions.delete(hash_token(token), user_id)
+
+async def revoke_user_sessions(user_id: str):
+    await repos.sessions.delete_all(user_id)
+
+async def count_sessions(user_id: str) -> int:
+    return await repos.sessions.count(user_id)
+
+async def _touch(session_id: str, bot: bool, now: datetime.datetime):
+    update = {'last_seen': now}
+
+    if not bot:
+        update['expires_at'] = now + session_ttl
+
+    await repos.sessions.touch(session_id, update)
+
+async def _resolve_legacy(token: str):
+    user = await repos.sessions.find_legacy(token)
+
+    if user == None:
+        return None
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+    await repos.sessions.move_legacy(_session_doc(token, user['_id'], user.get('bot', False), now), token)
+
+    return await repos.users.get(user['_id'], 'session_user')
+
+async def resolve_session(token: str):
+    session = await repos.sessions.resolve(hash_token(token))
+
+    if session == None:
+        return await _resolve_legacy(token) if legacy_fallback else None
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+    last_seen: datetime.datetime = session['last_seen'].replace(tzinfo=datetime.timezone.utc)
+
+    # the ttl monitor only runs once a minute, don't trust a stale document.
+    if session['expires_at'] and session['expires_at'].replace(tzinfo=datetime.timezone.utc) < now:
+        return None
+
+    if now - last_seen > touch_interval:
+        asyncio.get_running_loop().create_task(_touch(session['_id'], session['bot'], now))
+
+    return session['user']
@@ -1,15 +1,253 @@
-import snowflake as _snowflake
+import asyncio
+import datetime
+import fcntl
 import hashlib
+import logging
+import threading
 import dotenv
 import uuid
 import os
 import time
+from typing import List, Tuple, Union
+from pymongo.errors import DuplicateKeyError
+# as a module, database imports this one too.
+from . import database
 
 dotenv.load_dotenv()
-generator = _snowflake.Generator(1448841601000, int(os.getenv('process_id', 0)), int(os.getenv('worker_id', 0)))
 
-def snowflake():
-    return str(generator.generate(int(round(time.time() * 1000))))
+_log = logging.getLogger(__name__)
+
+# discord's layout: 42 bits of milliseconds since `epoch`, 10 bits of worker
+# id and a 12 bit sequence for ids made within the same millisecond.
+epoch = 1448841601000
+_worker_bits = 10
+_sequence_bits = 12
+max_worker = (1 << _worker_bits) - 1
+max_sequence = (1 << _sequence_bits) - 1
+# every id made from 2016-09-26 on is 18 digits long, from 2023-06-20 on 19,
+# and they stay 19 digits until 2091.
+id_lengths = (18, 19)
+
+# every process making ids needs its own worker id. `snowflake_lease` picks how
+# it gets one at startup: 'file' locks one of 1024 files under
+# `snowflake_lease_dir` (enough for one host), 'mongo' leases one from the
+# database (any number of hosts) and 'none' keeps `snowflake_worker_id`.
+lease_mode = os.getenv('snowflake_lease', 'file')
+lease_dir = os.getenv('snowflake_lease_dir', '/tmp/rails-snowflake')
+lease_ttl = int(os.getenv('snowflake_lease_ttl', 60))
+
+
+class Generator:
+    def __init__(self, worker_id: int):
+        self.worker_id = worker_id
+        self._lock = threading.Lock()
+        self._last = 0
+        self._sequence = 0
+
+    @property
+    def worker_id(self) -> int:
+        return self._worker_id
+
+    @worker_id.setter
+    def worker_id(self, value: int):
+        if not 0 <= value <= max_worker:
+            raise ValueError(f'worker id must be within 0-{max_worker}')
+
+        self._worker_id = value
+
+    def _reserve(self, count: int):
+        # hands out `count` sequence numbers, moving on to the next millisecond
+        # once one is used up. the clock is never allowed to go backwards, ids
+        # borrow from the future instead and the wall clock catches up.
+        with self._lock:
+            now = max(int(time.time() * 1000), self._last)
+
+            if now == self._last:
+                start = self._sequence
+            else:
+                start = 0
+
+            taken = []
+
+            while count:
+                n = min(count, max_sequence + 1 - start)
+
+                if n == 0:
+                    now += 1
+                    start = 0
+                    continue
+
+                taken.append((now, start, n))
+                start += n
+                count -= n
+
+            self._last = now
+            self._sequence = start
+
+        return taken
+
+    def generate(self) -> int:
+        (ms, sequence, _), = self._reserve(1)
+        return (ms - epoch) << 22 | self._worker_id << _sequence_bits | sequence
+
+    def generate_many(self, count: int) -> List[int]:
+        base = self._worker_id << _sequence_bits
+        return [
+            (ms - epoch) << 22 | base | (start + i)
+            for ms, start, n in self._reserve(count)
+            for i in range(n)
+        ]
+
+
+generator = Generator(
+    int(os.getenv('snowflake_worker_id', (int(os.getenv('worker_id', 0)) << 5) | int(os.getenv('process_id', 0))))
+)
+
+
+def snowflake() -> str:
+    return str(generator.generate())
+
+def snowflakes(count: int) -> List[str]:
+    # for bulk inserts, one lock round for the whole batch.
+    return [str(i) for i in generator.generate_many(count)]
+
+def parse_snowflake(value) -> str:
+    if value is None or not str(value).isascii() or not str(value).isdigit():
+        return None
+
+    # stored ids are never padded.
+    return str(int(value))
+
+def id_key(value: str) -> Tuple[int, str]:
+    # ids are digit strings of different lengths, string order is only time
+    # order between ids of the same length.
+    return len(value), value
+
+def id_ranges(bounds: dict) -> List[dict]:
+    # splits `bounds` ($gt, $gte, $lt, $lte on ids) into one string range per
+    # id length, shortest first, so every range sorts in time order on the
+    # index. each range pins its length with a regex, which mongo checks on
+    # the index keys it scans.
+    ranges = []
+
+    for n in id_lengths:
+        query = {}
+
+        for op, value in bounds.items():
+            if len(value) == n:
+                query[op] = value
+            elif (len(value) < n) == (op in ('$lt', '$lte')):
+                # the whole length is on the wrong side of the bound.
+                break
+        else:
+            if not query.keys() & {'$gt', '$gte'}:
+                query['$gte'] = '1' + '0' * (n - 1)
+            if not query.keys() & {'$lt', '$lte'}:
+                query['$lte'] = '9' * n
+            query['$regex'] = f'^[0-9]{{{n}}}$'
+            ranges.append(query)
+
+    return ranges
+
+def snowflake_time(value) -> datetime.datetime:
+    return datetime.datetime.fromtimestamp(((int(value) >> 22) + epoch) / 1000, datetime.timezone.utc)
+
+def time_snowflake(at: Union[datetime.datetime, float], high: bool = False) -> str:
+    # the lowest (or highest) id that could have been made at `at`.
+    ts = at.timestamp() if isinstance(at, datetime.datetime) else at
+    value = max((int(ts * 1000) - epoch) << 22, 0)
+
+    return str(value + (1 << 22) - 1 if high else value)
+
+def id_range(after: Union[datetime.datetime, float] = None, before: Union[datetime.datetime, float] = None) -> dict:
+    # an `_id` filter for documents created in a time window, no created_at index needed.
+    bounds = {}
+
+    if after is not None:
+        bounds['$gte'] = time_snowflake(after)
+    if before is not None:
+        bounds['$lt'] = time_snowflake(before)
+
+    ranges = id_ranges(bounds)
+
+    return {'$or': [{'_id': r} for r in ranges]} if ranges else {'_id': {'$in': []}}
+
+# worker id leasing
+_lease_file = None
+_lease_owner = uuid.uuid4().hex
+_lease_task: asyncio.Task = None
+
+
+def _lease_from_file() -> int:
+    global _lease_file
+    os.makedirs(lease_dir, exist_ok=True)
+
+    for worker_id in range(max_worker + 1):
+        f = open(os.path.join(lease_dir, f'worker-{worker_id}.lock'), 'w')
+
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            f.close()
+            continue
+
+        # the lock goes away with the process, however it exits.
+        _lease_file = f
+        return worker_id
+
+    raise RuntimeError(f'all {max_worker + 1} worker ids under {lease_dir} are taken')
+
+async def _claim(col, worker_id: int, now: datetime.datetime) -> bool:
+    expires_at = now + datetime.timedelta(seconds=lease_ttl)
+
+    try:
+        await col.insert_one({'_id': worker_id, 'owner': _lease_owner, 'expires_at': expires_at})
+        return True
+    except DuplicateKeyError:
+        r = await col.update_one(
+            {'_id': worker_id, '$or': [{'owner': _lease_owner}, {'expires_at': {'$lt': now}}]},
+            {'$set': {'owner': _lease_owner, 'expires_at': expires_at}},
+        )
+        return r.modified_count == 1
+
+async def _lease_from_mongo(col) -> int:
+    now = datetime.datetime.now(datetime.timezone.utc)
+
+    for worker_id in range(max_worker + 1):
+        if await _claim(col, worker_id, now):
+            return worker_id
+
+    raise RuntimeError(f'all {max_worker + 1} worker ids are leased')
+
+async def _renew(col):
+    while True:
+        await asyncio.sleep(lease_ttl / 3)
+
+        if not await _claim(col, generator.worker_id, datetime.datetime.now(datetime.timezone.utc)):
+            # someone took it over after we missed renewals, ids made from
+            # here on could collide with theirs.
+            generator.worker_id = await _lease_from_mongo(col)
+            _log.error('snowflake worker id lease was lost, moved to %d', generator.worker_id)
+
+async def lease():
+    global _lease_task
+
+    if lease_mode == 'file':
+        generator.worker_id = _lease_from_file()
+    elif lease_mode == 'mongo':
+        generator.worker_id = await _lease_from_mongo(database.snowflake_leases)
+        _lease_task = asyncio.get_running_loop().create_task(_renew(database.snowflake_leases))
+    elif lease_mode != 'none':
+        raise ValueError(f'unknown snowflake_lease {lease_mode!r}')
+
+    _log.info('making snowflakes as worker %d', generator.worker_id)
+
+async def release():
+    if _lease_task is not None:
+        _lease_task.cancel()
+
+    if lease_mode == 'mongo':
+        await database.snowflake_leases.delete_one({'_id': generator.worker_id, 'owner': _lease_owner})
 
 def hash_from(snowflake_: str = None) -> str:
     if snowflake_:
@@ -1,6 +1,6 @@
 import quart
-import json
-from ..database import users as users_db
+from ...encoding import respond
+from .. import repos
 from ..data_bodys import error_bodys
 from ..checks import check_session_
 
@@ -12,26 +12,12 @@ async def get_user(user_id: int):
     d = await check_session_(quart.request.headers.get('Authorization'))
 
     if d == None:
-        return quart.Response(error_bodys['no_auth'], 401)
+        return respond(error_bodys['no_auth'], 401)
 
-    user = users_db.find_one({'_id': user_id})
+    # only public info ever leaves the database.
+    user = await repos.users.get(user_id, 'public_user')
 
     if user == None:
-        return quart.Response(error_bodys['not_found'], 404)
+        return respond(error_bodys['not_found'], 404)
 
-    # filter out non-public info, like session_ids
-    user_data = {
-        '_id': user['_id'],
-        'username': user['username'],
-        'separator': user['separator'],
-        'bio': user['bio'],
-        'avatar_url': user['avatar_url'],
-        'banner_url': user['banner_url'],
-        'flags': user['flags'],
-        'verified': user['verified'],
-        'system': user['system'],
-        'created_at': user['created_at'],
-        'bot': user['bot']
-    }
-
-    return quart.Response(json.dumps(user_data), 200)
+    return respond(user, 200)
@@ -1,29 +1,31 @@
-import json
+import asyncio
 import dotenv
 import logging
 import os
-import hypercorn.asyncio
-import hypercorn.config
-import quart.flask_patch # type: ignore
 
 from quart import Quart, Response, request
 
-from .api.gateway import connect
+from .api import access_log, instrumentation
+from .api.encoding import OrjsonProvider, respond
+from .api.gateway import connect, get_metrics as gateway_metrics
 
 from .api.v3.guilds import channels as channels3, core as guilds_core3, messages as messages3
 from .api.v3.users import me as me3, core as users_core3
-from .api.v3.rate import rater as rater3, _reset as _reset3
+from .api.v3.rate import rater as rater3
 from .api.v3.ui import friends as friends3
-from .api.v3.database import loop, _init_indexes
+from .api.v3.database import bind, client, cache_stats, message_writer
+from .api.v3 import indexes, repos, snowflakes
 from .api.v3.applications import bots as bots3
-from .api.v3.errors import Error
+from .api.v3.errors import Error, ServiceUnavailable
 
 
 app = Quart(__name__)
+app.json = OrjsonProvider(app)
 dotenv.load_dotenv()
 app.config['debug'] = True
-logging.basicConfig(level=logging.DEBUG)
-rater3.init_app(app)
+logging.basicConfig(level=os.getenv('log_level', 'INFO').upper())
+# there is nothing to index with storage_backend=memory.
+index_gate = os.getenv('index_gate', '1') == '1' and repos.backend == 'mongo'
 
 
 @app.route('/gateway')
@@ -31,35 +33,52 @@ async def health_check():
     d = {
         'url': 'wss://gateway.vincentrps.xyz',
     }
-    return Response(json.dumps(d), 200)
+    return respond(d)
+
+if os.getenv('expose_metrics') == '1':
+    @app.route('/metrics')
+    async def metrics():
+        d = {
+            'gateway': gateway_metrics(),
+            'cache': cache_stats(),
+            'message_writes': message_writer.stats(),
+            'routes': instrumentation.routes,
+        }
+        return respond(d)
 
 @app.errorhandler(404)
 async def not_found(*_):
-    return json.dumps({'message': '404: Not Found', 'code': 0})
+    return respond({'message': '404: Not Found', 'code': 0}, 404)
 
 @app.errorhandler(500)
 async def internal(*_):
-    return json.dumps({'message': '500: Internal Server Error', 'code': 0})
+    return respond({'message': '500: Internal Server Error', 'code': 0}, 500)
 
 @app.errorhandler(429)
 async def ratelimited(*_):
-    return json.dumps({'message': '429: Too Many Requests', 'retry_after': rater3.current_limit.reset_at})
+    return respond({'message': '429: Too Many Requests', 'code': 0}, 429)
 
 @app.errorhandler(Error)
 async def handle_errors(err: Error):
-    return err._to_json()
+    return respond(err._to_json(), err.status_code)
+
+@app.before_request
+async def begin_request():
+    instrumentation.begin()
+
+    # queries would scan whole collections until the indexes are built.
+    if index_gate and not indexes.is_ready():
+        raise ServiceUnavailable('Starting Up')
 
 @app.after_request
-async def set_ratelimit(resp: Response):
-    print(f'DEBUG:api:Responded to {request.remote_addr} with {(await resp.get_data())}')
-    if rater3.current_limit:
-        resp.headers.add('X-RateLimit-Limit', rater3.current_limit.limit)
-        resp.headers.add('X-RateLimit-Remaining', rater3.current_limit.remaining)
-        resp.headers.add('X-RateLimit-Bucket', rater3._key_func())
-        resp.headers.add('X-RateLimit-Reset-After', rater3.current_limit.reset_at)
-    resp.headers['Content-Type'] = 'application/json'
+async def log_request(resp: Response):
+    instrumentation.finish(request.endpoint, resp)
+    await access_log.finish(request, resp)
     return resp
 
+# after the access log hooks, so its timing covers the limiter too.
+rater3.init_app(app)
+
 bps = {
     # v3
 
@@ -75,12 +94,31 @@ bps = {
 for value, suffix in bps.items():
     app.register_blueprint(value, url_prefix=suffix)
 
-cfg = hypercorn.config.Config()
-cfg.bind.clear()
-cfg.bind.append(f'0.0.0.0:{os.getenv("PORT")}')
+# per worker, run.py starts as many of these as it's told to.
+_background = []
+
+@app.before_serving
+async def startup():
+    bind()
+    access_log.start()
+    # before the first request can make an id.
+    await snowflakes.lease()
+
+    loop = asyncio.get_running_loop()
+    _background.append(loop.create_task(connect()))
+
+    if repos.backend == 'mongo':
+        _background.append(loop.create_task(indexes.apply()))
+
+@app.after_serving
+async def shutdown():
+    for task in _background:
+        task.cancel()
+
+    await asyncio.gather(*_background, return_exceptions=True)
+    _background.clear()
 
-loop.create_task(connect())
-loop.create_task(_init_indexes())
-loop.create_task(_reset3())
-loop.run_until_complete(hypercorn.asyncio.serve(app, cfg))
-loop.run_forever()
+    await message_writer.drain()
+    await snowflakes.release()
+    client.close()
+    access_log.stop()
@@ -14,9 +14,41 @@
 # ⠀⠀⠀⠀⠀⠀⠀⠹⣿⣿⣿⣿⣦⣤⣤⣤⣤⣾⣿⣿⣿⣿⣿⣿⣿⣿⡟⠀⠀⠀
 # ⠀⠀⠀⠀⠀⠀⠀⠀⠀⠉⠻⢿⣿⣿⣿⣿⣿⣿⠿⠋⠉⠛⠋⠉⠉⠁⠀⠀⠀⠀
 # ⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠈⠉⠉⠉⠁
+import argparse
 import os
+import hypercorn.config
+import hypercorn.run
 from dotenv import load_dotenv
 
 load_dotenv()
 
-os.system(f'hypercorn --bind 0.0.0.0:{os.getenv("PORT")} rails.core:app')
+
+def main():
+    parser = argparse.ArgumentParser(description='serve the rails api')
+    parser.add_argument('--workers', type=int, default=int(os.getenv('WEB_CONCURRENCY', 1)), help='worker processes, each on its own event loop')
+    parser.add_argument('--bind', default=f'0.0.0.0:{os.getenv("PORT", 8000)}')
+    parser.add_argument('--uvloop', action='store_true', default=os.getenv('use_uvloop') == '1', help='run workers on uvloop (pip install uvloop)')
+    args = parser.parse_args()
+
+    # one memory table per worker would multiply every limit by the worker
+    # count, spawned workers inherit this.
+    if args.workers > 1:
+        os.environ.setdefault('ratelimit_storage', 'shared')
+
+        if os.environ['ratelimit_storage'] == 'memory':
+            parser.error('ratelimit_storage=memory only limits per worker, use shared with --workers > 1')
+
+    cfg = hypercorn.config.Config()
+    cfg.application_path = 'rails.core:app'
+    cfg.bind = [args.bind]
+    # the sockets are bound once here and shared by every worker.
+    cfg.workers = args.workers
+    cfg.worker_class = 'uvloop' if args.uvloop else 'asyncio'
+    # the access log replaces hypercorn's own.
+    cfg.accesslog = None
+
+    return hypercorn.run.run(cfg)
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
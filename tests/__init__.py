@@ -0,0 +1,42 @@
+# python -m unittest discover tests
+#
+# the api runs in process on the memory storage backend. rails reads its
+# configuration at import time, so it is set here before a test imports it.
+import os
+import unittest
+
+os.environ.update({
+    'mongo_uri': 'mongodb://localhost',
+    'storage_backend': 'memory',
+    # nothing listens there, the gateway task just keeps retrying.
+    'gateway_url': 'ws://127.0.0.1:9',
+    'ratelimit_enabled': '0',
+    'access_log_sample': '0',
+    'index_gate': '0',
+    'snowflake_lease': 'none',
+    'session_legacy_fallback': '0',
+    'password_scrypt_n': str(1 << 10),
+})
+
+
+class AppTestCase(unittest.IsolatedAsyncioTestCase):
+    # a serving app per test, with a guild of `members` members and one channel
+    # of `messages` messages from the load harness' dataset.
+    members = 3
+    messages = 3
+
+    async def asyncSetUp(self):
+        from rails.core import app
+        from loadtest.dataset import generate
+
+        self.app = app.test_app()
+        await self.app.startup()
+        self.addAsyncCleanup(self.app.shutdown)
+
+        self.client = self.app.test_client()
+        self.dataset = await generate(1, self.members, 1, self.messages)
+        self.guild_id, self.tokens = next(iter(self.dataset.tokens.items()))
+        self.channel_id = self.dataset.channels[self.guild_id][0]
+
+    def auth(self, n: int = 0) -> dict:
+        return {'Authorization': self.tokens[n]}
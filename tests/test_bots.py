@@ -0,0 +1,16 @@
+from . import AppTestCase
+
+
+class DeleteBotTests(AppTestCase):
+    async def test_delete_bot(self):
+        resp = await self.client.post(
+            '/v3/bots', json={'username': 'helper', 'separator': '0042'}, headers=self.auth()
+        )
+        self.assertEqual(resp.status_code, 201)
+        bot = await resp.get_json()
+
+        resp = await self.client.delete(f'/v3/bots/{bot["_id"]}', headers={'Authorization': bot['token']})
+        self.assertEqual(resp.status_code, 204)
+
+        resp = await self.client.get('/v3/users/@me', headers={'Authorization': bot['token']})
+        self.assertEqual(resp.status_code, 401)
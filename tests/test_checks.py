@@ -0,0 +1,47 @@
+import asyncio
+from unittest import mock
+
+from . import AppTestCase
+
+
+class SessionCacheTests(AppTestCase):
+    async def test_invalidated_during_lookup(self):
+        from rails.api.v3 import checks
+
+        token = self.tokens[0]
+        user = await checks.check_session_(token)
+        checks.invalidate_session(token)
+
+        resolve = checks.resolve_session
+        started, invalidated = asyncio.Event(), asyncio.Event()
+        calls = []
+
+        async def slow_resolve(session_id):
+            calls.append(session_id)
+            found = await resolve(session_id)
+            started.set()
+            await invalidated.wait()
+            return found
+
+        with mock.patch.object(checks, 'resolve_session', slow_resolve):
+            pending = asyncio.ensure_future(checks.check_session_(token))
+            await started.wait()
+            checks.invalidate_user(user['_id'])
+            invalidated.set()
+            await pending
+
+            # what the query read may predate the invalidation, so it isn't kept.
+            await checks.check_session_(token)
+
+        self.assertEqual(len(calls), 2)
+
+    async def test_invalidations_are_forgotten(self):
+        from rails.api.v3 import checks
+
+        with mock.patch.object(checks._sessions, 'ttl', 0):
+            for i in range(100):
+                checks.invalidate_user(str(i))
+                await asyncio.sleep(0.001)
+
+        self.assertLess(len(checks._invalidated), 100)
+
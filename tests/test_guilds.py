@@ -0,0 +1,18 @@
+from . import AppTestCase
+
+
+class MembersTests(AppTestCase):
+    async def test_limit(self):
+        resp = await self.client.get(f'/v3/guilds/{self.guild_id}/members?limit=2', headers=self.auth())
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(await resp.get_json()), 2)
+
+    async def test_limit_not_a_number(self):
+        for limit in ('abc', '1.5', ''):
+            resp = await self.client.get(f'/v3/guilds/{self.guild_id}/members?limit={limit}', headers=self.auth())
+            self.assertEqual(resp.status_code, 400, limit)
+
+    async def test_limit_out_of_range(self):
+        for limit in ('0', '1001'):
+            resp = await self.client.get(f'/v3/guilds/{self.guild_id}/members?limit={limit}', headers=self.auth())
+            self.assertEqual(resp.status_code, 400, limit)
@@ -0,0 +1,18 @@
+from . import AppTestCase
+
+
+class MeTests(AppTestCase):
+    async def test_get_me(self):
+        resp = await self.client.get('/v3/users/@me', headers=self.auth())
+        self.assertEqual(resp.status_code, 200)
+        self.assertFalse((await resp.get_json())['verified'])
+
+    async def test_get_me_after_signup(self):
+        resp = await self.client.post('/v3/users/@me/signup', json={
+            'username': 'newcomer', 'separator': '0007', 'email': 'newcomer@example.com', 'password': 'password',
+        })
+        self.assertEqual(resp.status_code, 201)
+        session_id = (await resp.get_json())['session_id']
+
+        resp = await self.client.get('/v3/users/@me', headers={'Authorization': session_id})
+        self.assertEqual(resp.status_code, 200)